@@ -0,0 +1,271 @@
+"Benchmark for the timesheet tool. Generates timesheets and master workbooks of a set size, times each phase of the pipeline on them and writes the results to a json file so runs of different versions can be compared"
+
+import time
+from datetime import datetime, timedelta
+import os
+import sys
+import json
+import shutil
+import tempfile
+import platform
+import argparse
+import hashlib
+import importlib
+import itertools
+import logging
+
+## Usage ##
+# python benchmark.py                                   small run, 10 timesheets into a 1k row master, with and without a Data Validation sheet
+# python benchmark.py --timesheets 10 100 1000 --master-rows 1000 100000 500000 --output before.json
+# python benchmark.py --compare before.json --output after.json    prints each phase against an earlier run
+# Every combination of the sizes is run. Generated files go in a temp folder that is removed afterwards unless --keep is given
+
+TOOL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tool2.1.py")
+
+# Values the generated rows are made from, matching what real timesheets hold
+WORK_DESCRIPTIONS = ["4-Eng", "5-Splice", "2C-PM", "11-Watch", "4-Design review"]
+PAY_CODES = ["ST", "ST", "ST", "OT", "DT"]
+APPROVERS = ["Jane Smith", "Bob Jones", "Ann Lee", "Carl Diaz", "Dana Park"]
+MONTH_START = datetime(2024, 5, 1) #month the generated batch and master rows fall in
+
+def load_tool(folder):
+	"Imports tool2.1.py as timesheet_tool. The dot in the file name means it can't be imported by name, so a copy named timesheet_tool.py goes in folder on sys.path"
+	# worker processes started with spawn (Windows, macOS) get the same sys.path and import the copy to find run_timesheet_job
+	shutil.copy(TOOL_PATH, os.path.join(folder, "timesheet_tool.py"))
+	sys.path.insert(0, folder)
+	return importlib.import_module("timesheet_tool")
+
+def initials(name):
+	"Approver initials as they appear in the timesheet file names"
+	return "".join(part[0] for part in name.split())
+
+def make_master(file_path, row_count, with_validation, tool):
+	"Writes a master with 3 header rows and row_count data rows sorted by name and date, like a master after earlier runs. Every 50th row has a red highlight"
+	import openpyxl
+	from openpyxl.cell import WriteOnlyCell
+	from openpyxl.styles import PatternFill
+	workbook = openpyxl.Workbook(write_only=True) #write only so 500k rows don't have to sit in memory
+	sheet = workbook.create_sheet(MONTH_START.strftime("%B %Y"))
+	red_fill = PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid')
+	sheet.append(["Timesheet data"])
+	sheet.append([MONTH_START.strftime("%B %Y")])
+	sheet.append(["", "Name", "Code", "Task", "Date", "Note", "Work Description", "Time Type", "Approver", "Status", "Hours", "Week 1", "Week 2", "Week 3", "Week 4", "Week 5"])
+
+	# spread the rows over enough people that each has a row for each day of the month
+	days = 31
+	people = max(1, -(-row_count // days))
+	written = 0
+	for person in range(people):
+		for day in range(days):
+			if written == row_count:
+				break
+			row_date = MONTH_START + timedelta(days=day)
+			work_description = WORK_DESCRIPTIONS[written % len(WORK_DESCRIPTIONS)]
+			code = work_description.split("-")[0]
+			hours = 8
+			week = tool.get_week_of_month(row_date.strftime("%m/%d/%Y"))
+			row = ["", f"Master {person:06d}", "ISTHA" + code + "-BR16", "ISTHA Task " + code + tool.TASK_NAMES.get(code, ""), row_date,
+				"note", work_description, tool.PAY_TYPES[PAY_CODES[written % len(PAY_CODES)]], APPROVERS[written % len(APPROVERS)], "Approved", hours]
+			row += [None] * (week - 1) + [hours]
+			if written % 50 == 0:
+				name_cell = WriteOnlyCell(sheet, value=row[1])
+				name_cell.fill = red_fill
+				row[1] = name_cell
+			sheet.append(row)
+			written += 1
+
+	if with_validation:
+		validation_sheet = workbook.create_sheet("Data Validation")
+		validation_sheet.append(["Approver"])
+		for name in APPROVERS:
+			validation_sheet.append([name])
+	workbook.save(file_path)
+
+def make_timesheets(folder, count):
+	"Writes count timesheets in the standard layout named Name_Timesheet MMDDYYYY Approved XX.xlsx. Returns their paths"
+	import openpyxl
+	paths = []
+	for i in range(count):
+		sunday = MONTH_START + timedelta(days=(6 - MONTH_START.weekday()) % 7 + 7 * (i % 4)) #one of the month's Sundays
+		approver = APPROVERS[i % len(APPROVERS)]
+		workbook = openpyxl.Workbook()
+		sheet = workbook.active
+		sheet["C3"] = f"Worker {i:05d}"
+		sheet["G3"] = sunday
+		for row_offset in range(6):
+			row_idx = 13 + row_offset
+			sheet.cell(row_idx, 1, WORK_DESCRIPTIONS[(i + row_offset) % len(WORK_DESCRIPTIONS)])
+			sheet.cell(row_idx, 2, "note" if row_offset % 3 else None) #some notes left blank so gaps get highlighted
+			sheet.cell(row_idx, 4, PAY_CODES[row_offset % len(PAY_CODES)])
+			for day in range(1, 6): #Monday to Friday
+				sheet.cell(row_idx, 5 + day, 8 if row_offset == 0 else (row_offset + day) % 3)
+		file_path = os.path.join(folder, f"Worker{i:05d}_Timesheet {sunday.strftime('%m%d%Y')} Approved {initials(approver)}.xlsx")
+		workbook.save(file_path)
+		paths.append(file_path)
+	return paths
+
+class QuietDisplay:
+	"Display that drops every message, the phases are timed without any output in the way"
+	def clear(self):
+		pass
+
+	def write(self, text):
+		pass
+
+	def status(self, text):
+		pass
+
+	def update(self):
+		pass
+
+def run_case(tool, folder, timesheet_count, master_rows, with_validation, repeat, workers):
+	"Times each phase for one size of master and batch. Phases are run in pipeline order on the same session so each one sees real input. Returns phase -> seconds"
+	case_folder = os.path.join(folder, f"{timesheet_count}_{master_rows}_{'dv' if with_validation else 'nodv'}")
+	os.makedirs(case_folder)
+	master_path = os.path.join(case_folder, "Master.xlsx")
+
+	generate_start = time.perf_counter()
+	make_master(master_path, master_rows, with_validation, tool)
+	timesheet_paths = make_timesheets(case_folder, timesheet_count)
+	generate_time = time.perf_counter() - generate_start
+
+	# a share of the timesheets is selected twice, like a batch re-imported by mistake, so there are duplicates to find and delete
+	selected_paths = timesheet_paths + timesheet_paths[:int(len(timesheet_paths) * repeat)]
+
+	phases = {}
+	def timed(phase, function):
+		start = time.perf_counter()
+		result = function()
+		phases[phase] = time.perf_counter() - start
+		return result
+
+	my_instance = tool.MyClass(QuietDisplay())
+	my_instance.worker_count = workers
+	my_instance.Master_file_path = master_path
+	my_instance.Master_sheet_name = MONTH_START.strftime("%B %Y")
+	my_instance.master = tool.MasterWorkbook(master_path)
+	timed("load master", my_instance.master.load)
+	my_instance.approvers = tool.ApproverDirectory(master_path)
+	timed("approver directory", lambda: my_instance.approvers.build(my_instance.master.workbook))
+	my_instance.formatted_rows = timed("extract_data_with_formatting", lambda: my_instance.extract_data_with_formatting(my_instance.master, my_instance.Master_sheet_name))
+	timed("normalize_dates", lambda: tool.normalize_dates(my_instance.formatted_rows, my_instance.master.sheet(my_instance.Master_sheet_name)))
+	existing_rows = my_instance.remove_rows_with_empty_values(my_instance.formatted_rows)
+
+	if workers > 1:
+		timed("run_timesheets_parallel", lambda: my_instance.run_timesheets_parallel(selected_paths))
+	else:
+		timed("run_timesheet", lambda: [my_instance.run_timesheet(path, i, len(selected_paths)) for i, path in enumerate(selected_paths)])
+
+	new_rows = my_instance.remove_rows_with_empty_values(my_instance.rows_to_insert)
+
+	timed("validate", lambda: tool.RowValidator().validate(new_rows, my_instance.Master_sheet_name))
+	gap_style = my_instance.gap_style()
+	for record in new_rows:
+		record.gap_style = gap_style if record.gap_columns else None
+
+	# both ways of ordering the rows are timed, the full combine and sort and the merge into the sorted master
+	def combine_and_sort():
+		my_instance.combined_rows = my_instance.combine_data_with_formatting(existing_rows, new_rows)
+		my_instance.sort_combined_rows()
+	timed("combine and sort", combine_and_sort)
+	my_instance.combined_rows = timed("merge_sorted_rows", lambda: my_instance.merge_sorted_rows(existing_rows, new_rows))
+
+	timed("check_duplicates", lambda: my_instance.check_duplicates(my_instance.combined_rows, my_instance.Master_sheet_name))
+	timed("print_to_excel", lambda: my_instance.print_to_excel(my_instance.combined_rows, my_instance.first_changed_row(my_instance.formatted_rows, my_instance.combined_rows)))
+	timed("payroll rollup", lambda: my_instance.write_rollup(my_instance.Master_sheet_name, my_instance.combined_rows))
+	timed("save master", my_instance.master.save)
+	duplicate_count = sum(len(row_indexes) for row_indexes in my_instance.duplicate_rows.values())
+	timed("delete_duplicates (with its save)", lambda: my_instance.delete_duplicates(my_instance.master))
+	my_instance.master.close()
+
+	return {
+		"timesheets": timesheet_count,
+		"master_rows": master_rows,
+		"data_validation": with_validation,
+		"new_rows": len(new_rows),
+		"duplicates": duplicate_count,
+		"workers": workers,
+		"generate_seconds": round(generate_time, 4),
+		"phases": {phase: round(seconds, 4) for phase, seconds in phases.items()},
+	}
+
+def tool_version():
+	"Git commit of the tool if it is in a repository, and the hash of the file either way"
+	with open(TOOL_PATH, "rb") as tool_file:
+		file_hash = hashlib.sha256(tool_file.read()).hexdigest()[:12]
+	commit = None
+	try:
+		import subprocess
+		commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(TOOL_PATH), capture_output=True, text=True, timeout=10).stdout.strip() or None
+	except (OSError, subprocess.SubprocessError):
+		pass #not a git checkout
+	return {"commit": commit, "file_hash": file_hash}
+
+def compare(results, previous):
+	"Prints each phase of each case next to the same case in an earlier results file"
+	def case_key(case):
+		return (case["timesheets"], case["master_rows"], case["data_validation"], case["workers"])
+	previous_cases = {case_key(case): case for case in previous["cases"]}
+	for case in results["cases"]:
+		old_case = previous_cases.get(case_key(case))
+		print(f"\n{case['timesheets']} timesheets, {case['master_rows']} master rows, Data Validation {'on' if case['data_validation'] else 'off'}")
+		if old_case is None:
+			print("  not in the earlier run")
+			continue
+		for phase, seconds in case["phases"].items():
+			old_seconds = old_case["phases"].get(phase)
+			if old_seconds is None:
+				print(f"  {phase:<36} {seconds:>9.3f}s      new phase")
+			else:
+				change = (seconds - old_seconds) / old_seconds * 100 if old_seconds else 0.0
+				print(f"  {phase:<36} {seconds:>9.3f}s  was {old_seconds:.3f}s  {change:+.0f}%")
+
+def main(argv):
+	parser = argparse.ArgumentParser(description="Time each phase of the timesheet tool on generated data.")
+	parser.add_argument("--timesheets", type=int, nargs="+", default=[10], help="batch sizes to run, e.g. 10 100 1000")
+	parser.add_argument("--master-rows", type=int, nargs="+", default=[1000], help="master sizes to run, e.g. 1000 100000 500000")
+	parser.add_argument("--validation", choices=["both", "with", "without"], default="both", help="run with a Data Validation sheet, without one, or both")
+	parser.add_argument("--repeat", type=float, default=0.1, help="share of the timesheets selected twice to make duplicates")
+	parser.add_argument("--workers", type=int, default=1, help="processes used to parse timesheets, 1 times run_timesheet on its own")
+	parser.add_argument("--output", default="benchmark.json", help="json file the results are written to")
+	parser.add_argument("--compare", help="earlier results file to print the phases against")
+	parser.add_argument("--keep", action="store_true", help="keep the generated files")
+	args = parser.parse_args(argv)
+
+	folder = tempfile.mkdtemp(prefix="timesheet_benchmark_")
+	tool = load_tool(folder)
+	logging.getLogger("timesheets").setLevel(logging.WARNING)
+	validation_options = {"both": [True, False], "with": [True], "without": [False]}[args.validation]
+
+	results = {
+		"created": datetime.now().isoformat(timespec="seconds"),
+		"tool": tool_version(),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"openpyxl": __import__("openpyxl").__version__,
+		"cases": [],
+	}
+	try:
+		for timesheet_count, master_rows, with_validation in itertools.product(args.timesheets, args.master_rows, validation_options):
+			print(f"Running {timesheet_count} timesheets into {master_rows} master rows, Data Validation {'on' if with_validation else 'off'} ...")
+			case = run_case(tool, folder, timesheet_count, master_rows, with_validation, args.repeat, args.workers)
+			results["cases"].append(case)
+			for phase, seconds in case["phases"].items():
+				print(f"  {phase:<36} {seconds:>9.3f}s")
+	finally:
+		if args.keep:
+			print(f"Generated files kept in {folder}")
+		else:
+			shutil.rmtree(folder, ignore_errors=True)
+
+	with open(args.output, "w") as output_file:
+		json.dump(results, output_file, indent=2)
+	print(f"\nResults written to {args.output}")
+
+	if args.compare:
+		with open(args.compare, "r") as previous_file:
+			compare(results, json.load(previous_file))
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
@@ -1,281 +1,925 @@
 "This program imports the data from multiple time sheets into a master data file. All files are selected by the user. The program prints duplicate rows and organizes data by name and date"
 
-import openpyxl
-from openpyxl import Workbook, load_workbook
 import time
-import tkinter as tk
-from tkinter import Tk, filedialog, messagebox, scrolledtext, Checkbutton, Label
-from datetime import datetime, timedelta
+PROGRAM_START = time.perf_counter() #start of the startup budget, see startup_report
+from datetime import datetime, date
 import os
 import sys
 import re
-import pandas as pd
-import subprocess
-from PIL import ImageTk, Image
-from openpyxl.styles import Font, PatternFill, Border, Side, Alignment, PatternFill
+import json
+import importlib
+import copy
+import heapq
+import functools
+import calendar
+import hashlib
+import bisect
+import contextlib
+# Heavy modules are imported where the phase that needs them runs so the window opens fast:
+# openpyxl when a workbook is loaded or written, tkinter and PIL for the window only, subprocess to open the output,
+# concurrent.futures for the parallel parse and argparse, glob and logging for the headless mode
+
+STARTUP_BUDGET = 1.0 #seconds from start until the window is shown, the exe should open well under this
+startup_times = {"module imports": time.perf_counter() - PROGRAM_START} #step or module -> seconds, shown by startup_report
 
 
 ## Notes ##
 # Some features are built for the exe version and will not run in the python version correctly. These are the image display (since in the exe the image is packaged with the exe) and the initial directory for askopenfilename(s). Os.getcwd() is correct for the exe. Use os.path.dirname(__file__) for the python file
 
+# Each run adds the wall clock and CPU time of every phase and timesheet to .<master>.timings.json next to the master. --profile FILE (or TIMESHEET_PROFILE=FILE for the first run from the window) runs under cProfile
+# Every merged month sheet gets a "<month> Summary" sheet after it with the payroll totals per employee, pay type and task code for each week and the month (PayrollRollup)
+# --watch FOLDER in the headless mode keeps running and imports timesheets dropped into a shared folder in small debounced batches (watch_folder)
+# --store FILE in the headless mode keeps a SQLite TimesheetStore mirroring the month sheets each run merges, --query looks rows up there and --export-month rewrites a month sheet from it. The workbook stays the record, the store is only as current as the last run given it
+# benchmark.py next to this file times each phase of the pipeline on generated timesheets and masters, see python benchmark.py --help
+
 ## General workflow ##
+# Running the file with arguments skips the window and runs the same pipeline headless (main_cli), see python tool2.1.py --help
 # The program begins by inviting the user to select an output file and then a list of timesheets to add their data to the output file
+# From the window the run happens on a worker thread. Its messages come back through a queue the Tk thread polls with root.after (QueueDisplay), progress goes on the status line and Cancel stops the run before the master is saved
 # It checks Master sheet validity making sure the file is not open and is usable this is done with the test open file method.
-# It gets the name of the sheet it is inserting data to from get_sheet_name
-# Then it begins to process the master file, first opening and converting all existing dates to strings so that they can be sorted later on (read_rows)
-# Next it extracts the data from the master file including the cells formatting using extract_data_with_formatting
-# Then it begins to process the timesheets one at a time calling the run_timesheet method. It first checks if each file is usable with test_open_file and then extracts all the data and writes it to self.rows_to_insert
+# Each new row goes to the sheet for the month of its date (route_rows), so one batch can fill several month sheets. --month in the headless mode sends every row to one sheet
+# The master file is loaded once into a MasterWorkbook session, every phase below works on that same workbook and it is saved once at the end of the run
+# Approver initials are matched to names through an ApproverDirectory built once per run and cached next to the master until the master changes
+# Then it begins to process the master file, extracting the data including the cells formatting using extract_data_with_formatting
+# Existing dates are turned into MM/DD/YYYY strings in memory so that they can be sorted (normalize_dates), only the date cells that changed are set on the sheet
+# Then it begins to process the timesheets one at a time calling the run_timesheet method. open_timesheet checks each file is usable and reads it in the same load, then the data is expanded and written to self.rows_to_insert
+# With more than one worker the timesheets are parsed across a process pool instead (run_timesheets_parallel). parse_timesheet is the pure parse step both paths share, it returns plain row records that insert_records turns into formatted rows in selection order
 # If there were any corrupted or open files it prints out those error messages
-# During timesheet processing if missing data is found a red highlight is attached to that cell, otherwise the formatting is default
+# The new rows of each sheet are checked by RowValidator (blank fields, unknown pay types, missing task codes, hours outside 0 to 24, dates outside the month). Failing cells get a red highlight and the rows are listed after the run
 # Next, it combines the rows from the original master file and the new rows to insert into self.combined_rows
 # Then the program removes empty rows (defined as a row without a name or date or hours) and sorts by name and date
 # Finally the program writes these rows to the master file and master sheet. First deleting and clearing formatting of the sheet then inserting new rows
 # Next the system performs data checks for duplicate rows ignoring columns past column K
 # The program opens the master file once this is complete and asks the user if they would like to delete the duplicate rows (if any)
 
-## ONE KEY LIMITATION IS IN THE TIMESHEET FILES, DATA ROWS WITH MORE THAN 3 EMPTY ROWS ABOVE IT WILL NOT BE INCLUDED IN THE DATA. MAKE SURE ALL TIMESHEETS HAVE ALL THEIR DATA SEPARATED BY ONE OR TWO EMPTY ROWS NOT MORE
+## Timesheets in the standard layout are read in one streaming pass (read_timesheet_fast) and data rows are kept no matter how many empty rows are above them
+## ONE KEY LIMITATION REMAINS FOR TIMESHEETS THAT DO NOT MATCH THE STANDARD LAYOUT, THEY ARE READ THE OLD WAY AND DATA ROWS WITH MORE THAN 3 EMPTY ROWS ABOVE IT WILL NOT BE INCLUDED IN THE DATA
 
 # Custom exception for handling open file permission error, exits the program upon error so sheet is not tampered with
 class FileOpenError(Exception):
 	pass
 
+# Raised on the worker thread of a window run when Cancel is pressed, the run stops before the master is saved
+class RunCancelled(Exception):
+	pass
+
+# Pay type codes on the timesheets and the names written to the master
+PAY_TYPES = {"ST": "Regular Hours", "DT": "Double Time", "OT": "Overtime"}
+
+# Checks RowValidator can run on new rows, name -> what it flags. All of them run unless the run picks some
+VALIDATION_RULES = {
+	"blank": "blank name, note, work description, pay type or hours",
+	"pay type": "pay type code other than ST, OT or DT",
+	"task code": "work description that does not start with a task code such as 4- or 2C-",
+	"hours": "hours that are not a number from 0 to 24",
+	"month": "date outside the month of the sheet the row goes to",
+}
+HOURS_RANGE = (0, 24) #hours a single row can hold for one day
+TASK_CODE_PATTERN = re.compile(r"[0-9]+[A-Za-z]?") #task code at the start of a work description, before the first -
+
+# Names added to "ISTHA Task <code>" for the known task codes
+TASK_NAMES = {"4": " (Professional SVS Eng)", "5": " (UR Supp Splicing)", "2C": " (Prof SVS PM)", "11": " (Watch/Protect)"}
+
+class RowValidator:
+	"Checks new rows against the enabled VALIDATION_RULES. Each rule runs down one column of all the rows at once. Failing cells are marked for the red highlight and each row's problems are kept for the report"
+	def __init__(self, rules = None):
+		#param rules is a set of VALIDATION_RULES names, None runs them all
+		self.rules = set(VALIDATION_RULES) if rules is None else set(rules)
+	
+	def validate(self, records, sheet_name):
+		"Checks the TimesheetRow records going to one sheet and sets their gap_columns. Returns (record, problem texts) for each row with a problem, in the order given"
+		problems = [[] for record in records] #(column, text) for each row
+		if "blank" in self.rules:
+			for col, label, column in ((1, "name", [record.name for record in records]),
+										(5, "note", [record.note for record in records]),
+										(6, "work description", [record.work_description for record in records]),
+										(7, "pay type", [record.time_type for record in records]),
+										(10, "hours", [record.hours for record in records])):
+				for index, value in enumerate(column):
+					if is_none_or_spaces(value):
+						problems[index].append((col, f"blank {label}"))
+		# the other rules leave blank cells to the blank rule
+		if "pay type" in self.rules:
+			pay_types = set(PAY_TYPES.values())
+			for index, time_type in enumerate([record.time_type for record in records]):
+				if time_type not in pay_types and not is_none_or_spaces(time_type):
+					problems[index].append((7, f"unknown pay type {time_type}"))
+		if "task code" in self.rules:
+			for index, (work_description, code) in enumerate(zip([record.work_description for record in records], [record.code for record in records])):
+				if not is_none_or_spaces(work_description) and ("-" not in str(work_description) or not TASK_CODE_PATTERN.fullmatch(str(code).strip())):
+					problems[index].append((6, f"no task code in work description {work_description}"))
+		if "hours" in self.rules:
+			low, high = HOURS_RANGE
+			for index, hours in enumerate([record.hours for record in records]):
+				if is_none_or_spaces(hours):
+					continue
+				if isinstance(hours, bool) or not isinstance(hours, (int, float)) or not low <= hours <= high:
+					problems[index].append((10, f"hours {hours} not from {low} to {high}"))
+		if "month" in self.rules and month_sort_key(sheet_name)[1] == "": #only for month sheets
+			for index, date_ordinal in enumerate([record.date_ordinal for record in records]):
+				if month_sheet_name(date_ordinal) != sheet_name:
+					problems[index].append((4, f"date {date_text(date_ordinal)} not in {sheet_name}"))
+		
+		report = []
+		for record, row_problems in zip(records, problems):
+			record.gap_columns = tuple(sorted(set(col for col, text in row_problems)))
+			if row_problems:
+				report.append((record, [text for col, text in row_problems]))
+		return report
+
+class TimesheetRow:
+	"Compact record for one new master row from a timesheet. The date is kept as an ordinal and the week hours as a week number instead of padded columns. Reads like the list of (value, style ID) pairs the rest of the pipeline uses"
+	__slots__ = ("name", "code", "date_ordinal", "note", "work_description", "time_type", "approver", "hours", "week", "gap_columns", "gap_style")
+	
+	def __init__(self, name, code, date_ordinal, note, work_description, time_type, approver, hours, week, gap_columns):
+		self.name = name
+		self.code = code #task code from the start of the work description
+		self.date_ordinal = date_ordinal
+		self.note = note
+		self.work_description = work_description
+		self.time_type = time_type
+		self.approver = approver
+		self.hours = hours
+		self.week = week #week of the month, the hours are repeated in column 11 + week
+		self.gap_columns = gap_columns #columns to highlight red, set by RowValidator
+		self.gap_style = None #style ID of the red highlight, set when the row is added to the run
+	
+	def __len__(self):
+		#columns A to K, plus the week columns up to this row's week
+		return 11 + self.week if 1 <= self.week <= 5 else 11
+	
+	def value(self, col):
+		"Cell value of a column, worked out when it is needed"
+		if col == 0:
+			return ""
+		if col == 1:
+			return self.name
+		if col == 2:
+			return task_labels(self.code)[0]
+		if col == 3:
+			return task_labels(self.code)[1]
+		if col == 4:
+			return date_text(self.date_ordinal)
+		if col == 5:
+			return self.note
+		if col == 6:
+			return self.work_description
+		if col == 7:
+			return self.time_type
+		if col == 8:
+			return self.approver
+		if col == 9:
+			return "Approved"
+		if col == 10 or col == 10 + self.week:
+			return self.hours
+		return None #week columns before this row's week
+	
+	def key(self):
+		"Columns B to K, the same as duplicate_key gives for a row list but built straight from the fields"
+		code_label, task_label = task_labels(self.code)
+		return (self.name, code_label, task_label, date_text(self.date_ordinal), self.note, self.work_description, self.time_type, self.approver, "Approved", self.hours)
+	
+	def __getitem__(self, col):
+		if col < 0 or col >= len(self):
+			raise IndexError(col)
+		return (self.value(col), self.gap_style if col in self.gap_columns else None)
+	
+	def __iter__(self):
+		for col in range(len(self)):
+			yield self[col]
+
+class MasterWorkbook:
+	"Session object that holds the master workbook for a whole run so it is parsed once and saved once"
+	def __init__(self, file_path):
+		self.file_path = file_path
+		self.workbook = None
+		self.load_count = 0 #number of times the master was parsed this run, should stay at 1
+		self.save_count = 0 #number of times the master was saved this run, 1 unless duplicates are deleted
+	
+	def load(self):
+		"Loads the master file the first time it is needed and hands back the same workbook after that"
+		if self.workbook is None:
+			import openpyxl
+			self.workbook = openpyxl.load_workbook(self.file_path)
+			self.load_count += 1
+		return self.workbook
+	
+	def sheet(self, sheet_name):
+		"Returns a sheet of the loaded master, creating it if it does not exist yet"
+		workbook = self.load()
+		if sheet_name not in workbook.sheetnames:
+			return workbook.create_sheet(title = sheet_name)
+		return workbook[sheet_name]
+	
+	def save(self):
+		"Writes the master workbook back to disk, raises PermissionError if the file is open in Excel"
+		self.workbook.save(self.file_path)
+		self.save_count += 1
+	
+	def close(self):
+		"Releases the workbook at the end of a run"
+		if self.workbook is not None:
+			self.workbook.close()
+		self.workbook = None
+	
+	def summary(self):
+		"String of the load and save counts for the run so they can be checked"
+		return f"Master file loads: {self.load_count}, saves: {self.save_count}\n"
+
+class ApproverDirectory:
+	"Maps approver initials to full names from the Approver column of the master's Data Validation sheet. Built once per run and cached on disk next to the master"
+	def __init__(self, master_file_path):
+		self.master_file_path = master_file_path
+		self.cache_path = hidden_file_path(master_file_path, "approvers") #cache sits next to the master, e.g. .Master.xlsx.approvers.json
+		self.names = {} #initials -> full name
+		self.collisions = {} #initials -> every full name sharing those initials
+		self.from_cache = False #True when the directory was read from the cache instead of the sheet
+	
+	def file_stamp(self):
+		"Size and modified time of the master, the cache is only used when these match"
+		stat = os.stat(self.master_file_path)
+		return [stat.st_size, stat.st_mtime_ns]
+	
+	def load(self, master):
+		"Reads the directory from the cache if the master has not changed, otherwise builds it from the Data Validation sheet and rewrites the cache"
+		cache = read_json_file(self.cache_path, lambda cache: (cache["names"], cache["collisions"]) if cache["stamp"] == self.file_stamp() else None)
+		if cache is not None:
+			self.names, self.collisions = cache
+			self.from_cache = True
+			return
+		# missing, broken or stale cache, rebuild it
+		self.build(master.load())
+		self.write_cache()
+	
+	def build(self, workbook):
+		"Scans the Approver column once and indexes every name by its initials"
+		self.names = {}
+		self.collisions = {}
+		self.from_cache = False
+		if "Data Validation" not in workbook.sheetnames:
+			return
+		initials_sheet = workbook["Data Validation"]
+		
+		approver_column = None
+		for cell in initials_sheet[1]:
+			if cell.value == "Approver":
+				# find the header Approver
+				approver_column = cell.column
+				break
+		if approver_column is None:
+			return
+		
+		# go down the column until the first empty cell, same as the list has always been read
+		for (cell_value,) in initials_sheet.iter_rows(min_row=2, min_col=approver_column, max_col=approver_column, values_only=True):
+			if cell_value is None:
+				break
+			name_parts = str(cell_value).split()
+			if not name_parts:
+				continue
+			initials = name_parts[0][0] + name_parts[-1][0]
+			if initials in self.collisions:
+				self.collisions[initials].append(cell_value)
+			elif initials in self.names:
+				# second approver with the same initials, neither can be picked safely
+				self.collisions[initials] = [self.names.pop(initials), cell_value]
+			else:
+				self.names[initials] = cell_value
+	
+	def write_cache(self):
+		"Saves the directory with the current master stamp, a failed write only costs a rebuild next run"
+		try:
+			stamp = self.file_stamp()
+		except OSError:
+			return
+		write_json_file(self.cache_path, {"stamp": stamp, "names": self.names, "collisions": self.collisions})
+	
+	def restamp(self):
+		"Called after this program saves the master so its own save does not invalidate the cache"
+		self.write_cache()
+	
+	def resolve(self, initials):
+		"Returns the full name for the initials, colliding or unknown initials are returned unchanged"
+		return self.names.get(initials, initials)
+	
+	def collision_messages(self):
+		"One message per set of initials shared by more than one approver"
+		return [f"\n[APPROVER] Initials {initials} match more than one approver ({', '.join(names)}). These initials were left in place.\n" for initials, names in self.collisions.items()]
+
+class TimesheetStore:
+	"Optional SQLite mirror of the master's rows for fast lookups. Each run given the store brings the sheets it merges in step with the workbook, which stays the file people edit. Indexed on name and date and on approver and date, columns B to K are unique so it never holds a duplicate. Month sheets are exported from it in the master layout"
+	SCHEMA = """
+		CREATE TABLE IF NOT EXISTS rows (
+			id INTEGER PRIMARY KEY,
+			sheet TEXT NOT NULL,
+			name TEXT,
+			code TEXT,
+			code_label TEXT,
+			task TEXT,
+			date_ordinal INTEGER,
+			date_text TEXT,
+			note TEXT,
+			work_description TEXT,
+			time_type TEXT,
+			approver TEXT,
+			status TEXT,
+			hours,
+			gap_columns TEXT NOT NULL,
+			source TEXT,
+			row_key TEXT NOT NULL UNIQUE
+		);
+		CREATE INDEX IF NOT EXISTS rows_name_date ON rows (name, date_ordinal);
+		CREATE INDEX IF NOT EXISTS rows_approver_date ON rows (approver, date_ordinal);
+		CREATE INDEX IF NOT EXISTS rows_sheet ON rows (sheet, name, date_ordinal);
+	"""
+	COLUMNS = ("sheet", "name", "code", "code_label", "task", "date_ordinal", "date_text", "note", "work_description", "time_type", "approver", "status", "hours", "gap_columns", "source", "row_key")
+	
+	def __init__(self, store_path):
+		import sqlite3
+		self.store_path = store_path
+		self.connection = sqlite3.connect(store_path)
+		self.connection.executescript(self.SCHEMA)
+		self.added = 0 #rows added since the last commit
+		self.already_stored = 0 #rows left out since the last commit because their columns B to K were already in the store
+	
+	def add_rows(self, sheet_name, rows, source = None):
+		"Adds master rows or TimesheetRow records to a sheet inside the open transaction, rows already in the store are left out"
+		values = []
+		for row in rows:
+			key = duplicate_key(row)
+			name, code_label, task, date_value, note, work_description, time_type, approver, status, hours = key
+			if isinstance(row, TimesheetRow):
+				code = row.code
+				date_ordinal = row.date_ordinal
+				gap_columns = list(row.gap_columns)
+			else:
+				# rows read from the master, the task code and gaps are worked out again the way parse_timesheet finds them
+				code = task_code(code_label)
+				date_ordinal, text = date_sort_value(date_value)
+				date_ordinal = None if text else date_ordinal
+				gap_columns = [col for col, value in ((1, name), (5, note), (6, work_description), (7, time_type), (10, hours)) if is_none_or_spaces(value)]
+			date_value = date_value.strftime("%m/%d/%Y") if isinstance(date_value, datetime) else date_value
+			values.append((sheet_name, name, code, code_label, task, date_ordinal, date_value, note, work_description, time_type, approver, status, hours, json.dumps(gap_columns), source, json.dumps(key, default = str)))
+		before = self.connection.total_changes
+		self.connection.executemany(f"INSERT OR IGNORE INTO rows ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})", values)
+		added = self.connection.total_changes - before
+		self.added += added
+		self.already_stored += len(values) - added
+	
+	def remove_rows(self, row_keys):
+		"Removes rows by their columns B to K inside the open transaction, e.g. the old rows of a changed timesheet"
+		self.connection.executemany("DELETE FROM rows WHERE row_key = ?", [(json.dumps(key, default = str),) for key in row_keys])
+	
+	def commit(self):
+		"Commits the rows added and removed since the last commit in one transaction"
+		self.connection.commit()
+		text = f"Store: added {self.added} rows, {self.already_stored} were already in {os.path.basename(self.store_path)}.\n"
+		self.added = 0
+		self.already_stored = 0
+		return text
+	
+	def rollback(self):
+		"Drops everything since the last commit, the store stays as it was before the run"
+		self.connection.rollback()
+		self.added = 0
+		self.already_stored = 0
+	
+	def close(self):
+		self.connection.close()
+	
+	def query(self, name = None, approver = None, code = None, start_ordinal = None, end_ordinal = None):
+		"Rows matching every given filter in name and date order, as tuples of sheet, name, code, task, date, work description, time type, approver and hours. Dates are ordinals and the ends are included"
+		conditions = []
+		parameters = []
+		for column, value in (("name", name), ("approver", approver), ("code", code)):
+			if value is not None:
+				conditions.append(f"{column} = ?")
+				parameters.append(value)
+		if start_ordinal is not None:
+			conditions.append("date_ordinal >= ?")
+			parameters.append(start_ordinal)
+		if end_ordinal is not None:
+			conditions.append("date_ordinal <= ?")
+			parameters.append(end_ordinal)
+		where = " WHERE " + " AND ".join(conditions) if conditions else ""
+		return self.connection.execute(f"SELECT sheet, name, code, task, date_text, work_description, time_type, approver, hours FROM rows{where} ORDER BY name, date_ordinal IS NULL, date_ordinal, date_text, id", parameters).fetchall()
+	
+	def prune_sheet(self, sheet_name, row_keys):
+		"Removes the rows of a sheet whose columns B to K are not in row_keys inside the open transaction, e.g. rows deleted in Excel"
+		keep = {json.dumps(key, default = str) for key in row_keys}
+		self.connection.executemany("DELETE FROM rows WHERE row_key = ?", [(row_key,) for row_key in self.sheet_keys(sheet_name) - keep])
+	
+	def sheet_keys(self, sheet_name):
+		"Columns B to K of every row the store holds for a month sheet, as the row_key texts"
+		return {row_key for (row_key,) in self.connection.execute("SELECT row_key FROM rows WHERE sheet = ?", (sheet_name,))}
+	
+	def month_rows(self, sheet_name, gap_style, row_styles = None):
+		"Rows of a month sheet as lists of (value, style ID) in the master layout, sorted by name and date. Gap columns get gap_style, the store keeps no other formats"
+		#param row_styles is row_key -> the style IDs of that row on the sheet, those rows keep the formats they have there
+		row_styles = row_styles or {}
+		rows = []
+		for (name, code_label, task, date_ordinal, date_value, note, work_description, time_type, approver, status, hours, gap_columns, row_key) in self.connection.execute(
+				"SELECT name, code_label, task, date_ordinal, date_text, note, work_description, time_type, approver, status, hours, gap_columns, row_key FROM rows WHERE sheet = ? ORDER BY name, date_ordinal IS NULL, date_ordinal, date_text, id", (sheet_name,)):
+			gap_columns = json.loads(gap_columns)
+			values = ["", name, code_label, task, date_value, note, work_description, time_type, approver, status, hours]
+			if date_ordinal is not None:
+				# hours again in the column of the row's week of the month
+				day = date.fromordinal(date_ordinal)
+				week = week_of_month_table(day.year, day.month)[day.day]
+				if 1 <= week <= 5:
+					values += [None] * (week - 1) + [hours]
+			styles = row_styles.get(row_key)
+			if styles is not None:
+				values += [None] * (len(styles) - len(values)) #styled blank cells after the hours stay too
+				rows.append([(value, styles[col] if col < len(styles) else None) for col, value in enumerate(values)])
+			else:
+				rows.append([(value, gap_style if col in gap_columns else None) for col, value in enumerate(values)])
+		return rows
+
+class PayrollRollup:
+	"Payroll totals of one month sheet, the hours per employee, pay type and task code for each week of the month and for the month. Written to a summary sheet next to the month sheet"
+	HEADER = ("Name", "Pay Type", "Task Code", "Week 1", "Week 2", "Week 3", "Week 4", "Week 5", "Month Total")
+	
+	def __init__(self):
+		self.totals = {} #(name, pay type, task code) -> hours for weeks 1 to 5 and the month
+	
+	def add_rows(self, rows):
+		"Adds the hours of master rows or TimesheetRow records in one pass. The week is the week column the hours were laid out in, rows without a number of hours are left out"
+		totals = self.totals
+		for row in rows:
+			if isinstance(row, TimesheetRow):
+				name, time_type, code, hours, week = row.name, row.time_type, row.code, row.hours, row.week
+			else:
+				name, time_type, code = row[1][0], row[7][0], task_code(row[2][0])
+				hours = row[10][0] if len(row) > 10 else None
+				week = next((col - 10 for col in range(11, min(len(row), 16)) if row[col][0] is not None), 0)
+			if isinstance(hours, bool) or not isinstance(hours, (int, float)):
+				continue
+			# blanks are kept as None, so a blank cell of a master row and a blank field of a new row land on the same line
+			key = (name if name != "" else None, time_type if time_type != "" else None, code if code != "" else None)
+			line = totals.get(key)
+			if line is None:
+				line = totals[key] = [0] * 6
+			if 1 <= week <= 5:
+				line[week - 1] += hours
+			line[5] += hours
+	
+	def write(self, sheet, month_name):
+		"Rewrites the summary sheet with a title, the header in row 3, a line per employee, pay type and task code and the month's total in the last row. Weeks with no hours are left blank"
+		from openpyxl.styles import Font
+		from openpyxl.cell.cell import Cell
+		bold = Font(bold = True)
+		# the sheet only ever holds this summary, so it is rebuilt from nothing straight in openpyxl's cell store like print_to_excel does
+		cells = sheet._cells
+		cells.clear()
+		sheet.cell(1, 1, f"Payroll summary for {month_name}").font = bold
+		for col_idx, heading in enumerate(self.HEADER, start = 1):
+			sheet.cell(3, col_idx, heading).font = bold
+		row_idx = 3
+		for key, hours in sorted(self.totals.items(), key = lambda item: tuple("" if value is None else str(value) for value in item[0])):
+			row_idx += 1
+			for col_idx, value in enumerate(key + tuple(hours), start = 1):
+				if value is not None and value != 0:
+					cells[(row_idx, col_idx)] = Cell(sheet, row = row_idx, column = col_idx, value = value)
+		row_idx += 1
+		sheet.cell(row_idx, 1, "Total").font = bold
+		for col_idx in range(4, len(self.HEADER) + 1):
+			sheet.cell(row_idx, col_idx, sum(hours[col_idx - 4] for hours in self.totals.values())).font = bold
+
+class FolderWatcher:
+	"Finds approved timesheets that appear or change in a folder. On Linux inotify wakes the watcher as soon as a file is written, a scan of the folder every poll_seconds is the fallback elsewhere and also catches network shares that send no events"
+	def __init__(self, folder, poll_seconds = 10.0):
+		self.folder = folder
+		self.poll_seconds = poll_seconds
+		self.stamps = {} #path -> (size, modified time) at the last scan
+		self.inotify_fd = open_inotify(folder)
+	
+	def scan(self):
+		"Approved timesheets that are new or whose size or modified time changed since the last scan, path -> (size, modified time)"
+		stamps = {}
+		with os.scandir(self.folder) as entries:
+			for entry in entries:
+				# Excel's ~$ lock files match the naming convention too
+				if entry.name.startswith("~$") or not entry.name.lower().endswith(".xlsx") or not check_file_name(entry.name):
+					continue
+				try:
+					stat = entry.stat()
+				except OSError:
+					continue #deleted while scanning
+				if entry.is_file():
+					stamps[entry.path] = (stat.st_size, stat.st_mtime_ns)
+		changed = {path: stamp for path, stamp in stamps.items() if self.stamps.get(path) != stamp}
+		self.stamps = stamps
+		return changed
+	
+	def wait(self, timeout):
+		"Waits up to timeout seconds, returns early when inotify says a file was written or moved in"
+		if self.inotify_fd is None:
+			time.sleep(timeout)
+			return
+		import select
+		readable, writable, failed = select.select([self.inotify_fd], [], [], timeout)
+		if readable:
+			try:
+				os.read(self.inotify_fd, 65536) #the events only wake the loop, the scan finds what changed
+			except BlockingIOError:
+				pass
+	
+	def close(self):
+		if self.inotify_fd is not None:
+			os.close(self.inotify_fd)
+			self.inotify_fd = None
+
+class ImportLedger:
+	"Record of the timesheets imported into a master, kept in a hidden json file next to the master. Holds each timesheet's size, modified time, content hash and the rows it added"
+	def __init__(self, master_file_path):
+		self.ledger_path = hidden_file_path(master_file_path, "ledger") #ledger sits next to the master, e.g. .Master.xlsx.ledger.json
+		self.entries = {} #timesheet file name -> {"size", "mtime", "hash", "rows"}, rows is sheet name -> columns B to K of the rows added there
+	
+	def load(self):
+		"Reads the ledger, a missing or broken ledger starts empty"
+		self.entries = read_json_file(self.ledger_path, lambda ledger: ledger["timesheets"]) or {}
+	
+	def save(self):
+		"Writes the ledger, only called after the master itself was saved so the two agree"
+		write_json_file(self.ledger_path, {"timesheets": self.entries}, default=str) #if it fails the next run re-imports and dedupe or the duplicate check catches it
+	
+	def entry_key(self, file_path):
+		"Timesheets are known by file name so re-selecting a copied or moved folder still matches"
+		return os.path.basename(file_path).lower()
+	
+	def status(self, file_path):
+		"new, unchanged or changed. An unchanged size and modified time is decided from os.stat alone without opening the file"
+		entry = self.entries.get(self.entry_key(file_path))
+		if entry is None:
+			return "new"
+		stat = os.stat(file_path)
+		if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime"]:
+			return "unchanged"
+		if file_hash(file_path) == entry["hash"]:
+			# saved again without changes, keep the new stamp so the next check is a stat again
+			entry["size"] = stat.st_size
+			entry["mtime"] = stat.st_mtime_ns
+			return "unchanged"
+		return "changed"
+	
+	def old_rows(self, file_path):
+		"Columns B to K of the rows a changed timesheet added last time, by the sheet they went to"
+		entry = self.entries.get(self.entry_key(file_path))
+		if entry is None or not isinstance(entry.get("rows"), dict):
+			return {} #not imported before, or an entry from before rows were kept by sheet
+		return {sheet_name: [tuple(row) for row in rows] for sheet_name, rows in entry["rows"].items()}
+	
+	def rows_missing(self, file_path, sheet_keys):
+		"True if a row the timesheet added last time is no longer on its sheet, e.g. the master was restored from a backup or the row was deleted in Excel"
+		#param sheet_keys gives the set of columns B to K of a sheet's rows for a sheet name
+		return any(row not in sheet_keys(sheet_name) for sheet_name, rows in self.old_rows(file_path).items() for row in rows)
+	
+	def record(self, file_path, row_keys):
+		"Stores a timesheet that was just imported with the rows it added, row_keys is sheet name -> row keys"
+		stat = os.stat(file_path)
+		self.entries[self.entry_key(file_path)] = {
+			"size": stat.st_size,
+			"mtime": stat.st_mtime_ns,
+			"hash": file_hash(file_path),
+			"rows": {sheet_name: [list(key) for key in keys] for sheet_name, keys in row_keys.items()},
+		}
+
+class RunTimer:
+	"Wall clock and CPU time of each phase of a run and of each timesheet, written to a json log next to the master so slow runs can be looked at afterwards"
+	RUNS_KEPT = 50 #older runs are dropped from the log
+	
+	def __init__(self, master_file_path = None):
+		#param master_file_path of None keeps the spans in memory only
+		self.log_path = None
+		if master_file_path is not None:
+			self.log_path = hidden_file_path(master_file_path, "timings") #log sits next to the master, e.g. .Master.xlsx.timings.json
+		self.run_id = time.time_ns() #tells this run apart when it is saved again after deleting duplicates
+		self.started = datetime.now().isoformat(timespec="seconds")
+		self.run_start = time.perf_counter()
+		self.spans = [] #{"phase", "wall", "cpu"} plus details such as the sheet or timesheet
+		self.current = None #(phase, details, wall start, cpu start) of the phase running now
+	
+	def phase(self, phase, **details):
+		"Ends the phase running now and starts the next one, phase None only ends it"
+		now_wall, now_cpu = time.perf_counter(), time.process_time()
+		if self.current is not None:
+			current_phase, current_details, wall_start, cpu_start = self.current
+			self.add(current_phase, now_wall - wall_start, now_cpu - cpu_start, **current_details)
+		self.current = None if phase is None else (phase, details, now_wall, now_cpu)
+	
+	@contextlib.contextmanager
+	def span(self, phase, **details):
+		"Times the block inside a with statement, used for each timesheet inside the parse phase"
+		wall_start, cpu_start = time.perf_counter(), time.process_time()
+		try:
+			yield
+		finally:
+			self.add(phase, time.perf_counter() - wall_start, time.process_time() - cpu_start, **details)
+	
+	def add(self, phase, wall, cpu, **details):
+		"Records a finished span, also used for timesheets timed inside a worker process"
+		self.spans.append(dict(phase = phase, wall = round(wall, 6), cpu = round(cpu, 6), **details))
+	
+	def total(self):
+		"Seconds since the run started"
+		return time.perf_counter() - self.run_start
+	
+	def save(self):
+		"Adds this run to the log or updates it if it was saved before. CPU times are this process only, timesheets parsed in a worker carry their own"
+		if self.log_path is None:
+			return
+		runs = read_json_file(self.log_path, lambda log: log["runs"]) or [] #missing or broken log, start a new one
+		runs = [run for run in runs if run.get("id") != self.run_id]
+		runs.append({"id": self.run_id, "started": self.started, "total": round(self.total(), 6), "spans": self.spans})
+		write_json_file(self.log_path, {"runs": runs[-self.RUNS_KEPT:]}, indent=1, default=str) #timings are only for looking at afterwards, never stop a run over them
+	
+	def summary(self):
+		"One line with the run time and the slowest phases"
+		slowest = sorted((span for span in self.spans if span["phase"] != "timesheet"), key=lambda span: span["wall"], reverse=True)[:3]
+		phases_text = ", ".join(f"{span['phase']}{' ' + span['sheet'] if 'sheet' in span else ''} {span['wall']:.2f}s" for span in slowest)
+		return f"Run took {self.total():.2f}s ({phases_text})\n"
+
+class StyleTable:
+	"Shared table of cell formats for a run. Each distinct format is stored once and rows hold its small integer ID instead of their own copies of the style objects"
+	def __init__(self):
+		self.styles = [] #ID -> StyleArray read from a master cell, or a dict of style attributes to set such as {"fill": red_fill}
+		self.ids = {} #format key -> ID
+		self.applied = {} #(ID, style the cell had) -> style it ends up with, so each format is only worked out once
+	
+	def intern(self, key, style):
+		"Returns the ID for key, adding style to the table the first time it is seen"
+		style_id = self.ids.get(key)
+		if style_id is None:
+			style_id = len(self.styles)
+			self.styles.append(style)
+			self.ids[key] = style_id
+		return style_id
+	
+	def intern_cell(self, cell):
+		"ID of a master cell's whole format, keyed on the cell's style index array so no style objects are copied"
+		# cell._style holds the ids of the font, fill, border, number format and alignment in the workbook's style lists, None for an unstyled cell
+		return self.intern(("cell", self.style_key(cell)), copy.copy(cell._style))
+	
+	def style_key(self, cell):
+		"Hashable form of the cell's style index array"
+		return tuple(cell._style) if cell._style is not None else None
+	
+	def intern_formatting(self, formatting):
+		"ID of a dict of style attributes that is set on top of the cell's existing format"
+		return self.intern(("attributes",) + tuple(sorted(formatting.items())), formatting)
+	
+	def apply(self, cell, style_id):
+		"Sets the format with this ID on a cell of the same workbook"
+		style = self.styles[style_id]
+		if not isinstance(style, dict):
+			cell._style = copy.copy(style) #whole format read from the master, one array copy (None copies as None)
+			return
+		key = (style_id, self.style_key(cell))
+		result = self.applied.get(key)
+		if result is None:
+			# first time for this format on this kind of cell, set the attributes and remember the outcome
+			for attribute, value in style.items():
+				setattr(cell, attribute, value)
+			self.applied[key] = copy.copy(cell._style)
+		else:
+			cell._style = copy.copy(result)
+
+class WindowDisplay:
+	"Progress output for the window, writes messages to the scrolled text box and progress to the status line under it"
+	def __init__(self, root, scroll_text, status_label):
+		self.root = root
+		self.scroll_text = scroll_text
+		self.status_label = status_label
+	
+	def clear(self):
+		"Clears the text box"
+		self.scroll_text.configure(state='normal')
+		self.scroll_text.delete('1.0', tk.END) 
+		self.scroll_text.configure(state = 'disabled')
+	
+	def write(self, text):
+		"Adds text to the end of the text box and scrolls to it"
+		self.scroll_text.configure(state='normal')
+		self.scroll_text.insert(tk.END, text)
+		self.scroll_text.see(tk.END) #scroll to bottom
+		self.scroll_text.configure(state = 'disabled')
+	
+	def status(self, text):
+		"Shows text on the status line, the text box is left alone"
+		self.status_label.config(text = text.strip())
+	
+	def update(self):
+		"Yields to the Tk loop so the window keeps drawing"
+		self.root.update()
+
+class LogDisplay:
+	"Progress output for headless runs, every message goes to the timesheets logger"
+	def __init__(self):
+		import logging
+		self.logger = logging.getLogger("timesheets")
+	
+	def clear(self):
+		pass #nothing to clear in a log
+	
+	def write(self, text):
+		"Logs each non blank line of text"
+		for line in text.split("\n"):
+			if line.strip():
+				self.logger.info(line.strip())
+	
+	def status(self, text):
+		self.write(text)
+	
+	def update(self):
+		pass #no event loop to yield to
+
+class QueueDisplay:
+	"Display for a window run on the worker thread. Each message is put on a queue that the Tk thread reads with root.after, Tk itself is never touched from the thread"
+	def __init__(self, events, cancel_requested):
+		self.events = events #queue of (kind, text) events for poll_run_events
+		self.cancel_requested = cancel_requested #threading.Event set by the Cancel button
+	
+	def clear(self):
+		self.events.put(("clear", ""))
+	
+	def write(self, text):
+		self.events.put(("write", text))
+	
+	def status(self, text):
+		self.events.put(("status", text))
+	
+	def update(self):
+		"Called between steps of a run, stops the run here if Cancel was pressed"
+		if self.cancel_requested.is_set():
+			raise RunCancelled()
+
 class MyClass:
 	# Class used so that file paths selected can be global
-	def __init__(self):
+	def __init__(self, display = None):
 		# declares global variables
+		self.display = display # WindowDisplay for the window or LogDisplay for headless runs
 		self.Master_file_path = None  # File path of output code
-		self.duplicate_row_list = [] # list to have the option to delete cells after consulting master sheet
-		self.Master_sheet_name = None #once sheet name is found, keep for whole run
+		self.master = None # MasterWorkbook session, loaded once and saved once per run
+		self.approvers = None # ApproverDirectory for the run, initials -> approver name
+		self.duplicate_rows = {} # sheet name -> duplicate rows, to have the option to delete them after consulting master sheet
+		self.Master_sheet_name = None #sheet currently being merged
+		self.fixed_sheet_name = None #sheet every row goes to when the run names one, None sends each row to the sheet for its month
 		self.formatted_rows = [] #gets the old existing rows with formatting
+		self.style_table = StyleTable() #formats of the rows, the rows only hold style IDs into this table
 		self.rows_to_insert = [] #gets the new rows
+		self.imported_rows = {} #timesheet path -> the rows it added this run, for the import ledger
+		self.written_row_ids = set() #ids of the new rows that went into a sheet, dedupe on ingest leaves the others out of the ledger
+		self.ledger = None #ImportLedger of the master
+		self.use_ledger = True #skip timesheets the ledger says were already imported unchanged, False imports everything selected
+		self.store_path = None #SQLite file mirroring the master, None runs without a store
+		self.payroll_summary = True #keep a payroll summary sheet next to each month sheet
+		self.store = None #TimesheetStore of the run
 		self.combined_rows = [] #all combined rows
-		self.found_gaps = False #flag for gaps found in new rows to display to user
+		self.validation_rules = set(VALIDATION_RULES) #checks run on the new rows, see RowValidator
+		self.violations = {} #sheet name -> (row number, problem texts) for new rows that failed a check, shown after the run
+		self.worker_count = os.cpu_count() or 1 #processes used to parse timesheets, 1 parses them one at a time on the GUI thread
+		self.dedupe_on_ingest = False #drop incoming rows that are already in the master instead of listing them as duplicates
+		self.incremental_merge = True #merge new rows into an already sorted master and rewrite only from the first changed row, False always re-sorts and rewrites everything
+		self.timer = RunTimer() #phase and timesheet timings of the run, replaced with one that logs next to the master in run_pipeline
+		self.profile_path = None #set to a file name to run the next run under cProfile and write its stats there
+		self.run_thread = None #worker thread of a window run, None when no run is going
+		self.close_requested = False #the window was closed during a run, it closes once the run is done
 	
 	def run_timesheets(self):
-		"This method operates first, allowing user to select files and then running through all the timesheets"
-		# resets master varaibles to none before each new request
-		self.duplicate_row_list = []
-		self.formatted_rows = []
-		self.rows_to_insert = []
-		self.found_gaps = False
-		
+		"This method operates first, allowing user to select files and then starting the run on a worker thread"
 		# Configure buttons so user cannot repress buttons during a run
 		timesheet_button.config(state = tk.DISABLED)
 		instructions_button.config(state = tk.DISABLED)
+		self.dedupe_on_ingest = dedupe_variable.get() #checkbox to skip rows already in the master
+		self.use_ledger = not reimport_variable.get() #checkbox to import timesheets the ledger says were already imported
 		
 		# Clear display at beginning of program
-		scroll_text.configure(state='normal')
-		scroll_text.delete('1.0', tk.END) 
-		scroll_text.configure(state = 'disabled')
+		self.display.clear()
 		
 		# get output file path and timesheets, start selection where .py or .exe file is located
-		self.Master_file_path = filedialog.askopenfilename(initialdir=os.getcwd(), title="Select Master sheet to write data to", filetypes=(("Master Sheet","*.xlsx"),))
+		Master_file_path = filedialog.askopenfilename(initialdir=os.getcwd(), title="Select Master sheet to write data to", filetypes=(("Master Sheet","*.xlsx"),))
 		
 		#check if no file selected and return to initial menu
-		if not self.Master_file_path:
-			scroll_text.configure(state='normal')
-			scroll_text.insert(tk.END, "Please select an output file to run the program.\n") 
-			scroll_text.configure(state = 'disabled')
+		if not Master_file_path:
+			self.display.write("Please select an output file to run the program.\n") 
 			timesheet_button.config(state = tk.ACTIVE)
 			instructions_button.config(state = tk.ACTIVE)
 			return
 		
 		# Get timesheet file paths
 		Timesheet_file_paths = filedialog.askopenfilenames(initialdir = os.getcwd(), title="Select Timesheets to insert", filetypes=(("Timesheets","*.xlsx"),))
-		num_paths = len(Timesheet_file_paths)
 		
 		#check if no timesheets selected and return to intial menu
-		if num_paths == 0:
-			scroll_text.configure(state='normal')
-			scroll_text.insert(tk.END, "Please select at least one timesheet to run the program.\n") 
-			scroll_text.configure(state = 'disabled')
+		if len(Timesheet_file_paths) == 0:
+			self.display.write("Please select at least one timesheet to run the program.\n") 
 			timesheet_button.config(state = tk.ACTIVE)
 			instructions_button.config(state = tk.ACTIVE)
 			return
-			
-		# get name of sheet you are inserting data to from helper method
-		self.Master_sheet_name = self.get_sheet_name(Timesheet_file_paths[0])
 		
-		# Test open master file path using helper method
-		result,text = self.test_open_file(self.Master_file_path, self.Master_sheet_name)
+		# run the merge, sort and duplicate check on a worker thread so the window stays responsive, its messages come back through a queue
+		import threading
+		import queue
+		self.window_display = self.display
+		self.run_events = queue.Queue()
+		self.cancel_requested = threading.Event()
+		self.display = QueueDisplay(self.run_events, self.cancel_requested)
+		cancel_button.config(state = tk.ACTIVE)
+		close_button.config(state = tk.DISABLED) #closing mid run could stop the thread while it saves the master
+		profile_path, self.profile_path = self.profile_path, None #only this run is profiled
+		self.run_thread = threading.Thread(target = self.run_in_background, args = (Master_file_path, Timesheet_file_paths, profile_path))
+		self.run_thread.start()
+		root.after(100, self.poll_run_events)
+	
+	def run_in_background(self, master_file_path, timesheet_file_paths, profile_path = None):
+		"Worker thread of a window run. Only talks to the window through the display's queue and ends with a done event holding the result"
+		#param profile_path is a file name to run this run under cProfile and write its stats there
+		try:
+			result = run_with_profile(profile_path, self.display, self.run_pipeline, master_file_path, timesheet_file_paths)
+		except RunCancelled:
+			self.display.write("\nRun cancelled, the output file was not changed.\n")
+			result = False
+		except Exception as e:
+			# an error on the thread would otherwise leave the buttons disabled
+			self.display.write(f"\nThe run stopped with an error: {e}\n")
+			result = False
+		self.run_events.put(("done", result))
+	
+	def poll_run_events(self):
+		"Runs on the Tk thread every 100 ms during a run, shows the worker thread's messages and finishes the run once it is done"
+		import queue
+		try:
+			while True:
+				kind, value = self.run_events.get_nowait()
+				if kind == "write":
+					self.window_display.write(value)
+				elif kind == "clear":
+					self.window_display.clear()
+				elif kind == "status":
+					self.window_display.status(value)
+				elif kind == "done":
+					self.finish_run(value)
+					return
+		except queue.Empty:
+			pass
+		root.after(100, self.poll_run_events)
+	
+	def cancel_run(self):
+		"Cancel button, the worker thread stops at its next step. Once the master is being saved the run finishes instead"
+		self.cancel_requested.set()
+		cancel_button.config(state = tk.DISABLED)
+		self.window_display.status("Cancelling ...")
+	
+	def close_window(self):
+		"Close box of the window. During a run it cancels the run and the window closes once the worker thread is done, so the master is never left half saved"
+		if self.run_thread is not None and self.run_thread.is_alive():
+			self.close_requested = True
+			self.cancel_run()
+			return
+		root.quit()
+	
+	def finish_run(self, result):
+		"Back on the Tk thread after the worker thread is done, opens the output and offers to delete duplicates"
+		self.run_thread.join()
+		self.run_thread = None
+		self.display = self.window_display
+		self.display.status("")
+		cancel_button.config(state = tk.DISABLED)
+		close_button.config(state = tk.ACTIVE)
+		
+		# the window was closed during the run, close it now that the master is saved or untouched
+		if self.close_requested:
+			if self.master is not None:
+				self.master.close()
+			root.quit()
+			return
+		
+		# stops here if the master couldn't be used or saved, or the run was cancelled
 		if not result:
-			scroll_text.configure(state='normal')
-			scroll_text.insert(tk.END, text) #prints the error message
-			scroll_text.configure(state = 'disabled')
+			if self.master is not None:
+				self.master.close()
 			timesheet_button.config(state = tk.ACTIVE)
 			instructions_button.config(state = tk.ACTIVE)
 			return
-			
-		#Initial Display
-		scroll_text.configure(state='normal')
-		scroll_text.insert(tk.END, "Accessing existing data...\n") 
-		scroll_text.configure(state = 'disabled')
-		root.update() #used to keep program from stalling throughout code
-		
-		# Convert dates from datetime to string for sorting
-		rows = self.read_rows(self.Master_file_path)
-		scroll_text.configure(state='normal')
-		scroll_text.delete('1.0', tk.END) 
-		scroll_text.insert(tk.END, "Accessing existing data... ...\n") 
-		scroll_text.configure(state = 'disabled')
-		root.update()
-		
-		# get the existing formatted rows from the sheet
-		self.formatted_rows = self.extract_data_with_formatting(self.Master_file_path,self.Master_sheet_name)
-		scroll_text.configure(state='normal')
-		scroll_text.delete('1.0', tk.END) 
-		scroll_text.insert(tk.END, "Accessing existing data... ... ...\n") 
-		scroll_text.configure(state = 'disabled')
-		root.update()
-		
-		def check_file_name(file_path):
-			# Define the regular expression pattern to match "Approved" followed by two letters A-Z
-			pattern = r"Approved [A-Z]{2}"
-
-			# Extract the filename from the file path
-			file_name = file_path.split("\\")[-1]
-
-			# Search for the pattern in the file name
-			match = re.search(pattern, file_name)
-
-			# If a match is found, return True, otherwise return False
-			return bool(match)
-		
-		# go through all the timesheet file paths and add to self.rows_to_insert, i and num_paths used for progress updates
-		text_list = [] #used to store all error messages to print after run
-		for i, timesheet in enumerate(Timesheet_file_paths):
-			if check_file_name(timesheet):
-				result, text = self.test_open_file(timesheet) #test open method and get error message 
-				if result: #if sheet okay run timesheet
-					self.run_timesheet(timesheet, i, num_paths)
-				if not result: #else append error message to text_list to print
-					text_list.append(text)
-			else:
-				text_list.append(f"\n[UNAPPROVED] File '{os.path.basename(timesheet)}' is not usable because it is not approved and doesn't match the naming convention.\n")
-		
-		# Display all error messages
-		scroll_text.configure(state='normal')
-		for message in text_list:
-			scroll_text.insert(tk.END, message)
-		scroll_text.insert(tk.END, "\n")
-		scroll_text.configure(state = 'disabled')
-		
-		#Display configurations
-		scroll_text.configure(state='normal')
-		scroll_text.insert(tk.END, "\n\n\nData gathered, organizing ... \n") 
-		scroll_text.configure(state = 'disabled')
-		root.update()
-		
-		# Combine the existing and new data rows
-		self.combined_rows = self.combine_data_with_formatting(self.formatted_rows, self.rows_to_insert)
-		
-		# Block to display updates cleanly while keeping error messages from above
-		scroll_text.configure(state = 'normal')
-		# Get existing minus last line to print updates
-		cur_inp = scroll_text.get("1.0", tk.END) #get text on screen
-		lines = cur_inp.split('\n')
-		if lines[-3]:
-			lines = lines[:-3]
-		cur_inp_without_last_line = '\n'.join(lines) #keep up to last 3
-		scroll_text.delete('1.0', tk.END) #clear then insert with new progress line
-		scroll_text.insert(tk.END, cur_inp_without_last_line) 
-		scroll_text.insert(tk.END, "Data gathered, organizing ... ... \n") 
-		scroll_text.configure(state = 'disabled')
-		root.update()
-		
-		# remove empty rows
-		self.combined_rows = self.remove_rows_with_empty_values(self.combined_rows)
-		
-		scroll_text.configure(state = 'normal')
-		cur_inp = scroll_text.get("1.0", tk.END)
-		lines = cur_inp.split('\n')
-		if lines[-3]:
-			lines = lines[:-3]
-		cur_inp_without_last_line = '\n'.join(lines)
-		scroll_text.delete('1.0', tk.END) 
-		scroll_text.insert(tk.END, cur_inp_without_last_line) 
-		scroll_text.insert(tk.END, "Data gathered, organizing ... ... ...\n") 
-		scroll_text.configure(state = 'disabled')
-		root.update()
-		
-		# Sort the rows
-		self.sort_combined_rows()
-		
-		scroll_text.configure(state = 'normal')
-		cur_inp = scroll_text.get("1.0", tk.END)
-		lines = cur_inp.split('\n')
-		if lines[-3]:
-			lines = lines[:-3]
-		cur_inp_without_last_line = '\n'.join(lines)
-		scroll_text.delete('1.0', tk.END) 
-		scroll_text.insert(tk.END, cur_inp_without_last_line) 
-		scroll_text.insert(tk.END, "Data gathered, organizing ... ... ... ...\n") 
-		scroll_text.configure(state = 'disabled')
-		root.update()
-		
-		# Delay for procesing
-		time.sleep(1)
-		
-		#rewrite combined rows to Master sheet
-		new_file_path = self.print_to_excel(self.combined_rows)
-		
-		# display configurations
-		scroll_text.configure(state='normal')
-		scroll_text.insert(tk.END, "Checking for duplicates ... \n") 
-		scroll_text.configure(state = 'disabled')
-		root.update()
-		
-		# delay for processing
-		time.sleep(1)
-		
-		#check for duplicates
-		self.check_duplicates(self.Master_file_path)
-		if len(self.duplicate_row_list) == 0:
-			scroll_text.configure(state='normal')
-			scroll_text.insert(tk.END, "No duplicates found.\n") 
-			scroll_text.configure(state = 'disabled')
-		
-		#delay for processing
-		time.sleep(1)
-		
-		# Check for data gaps
-		if self.found_gaps: #flag set during run timesheet method
-			# Display configurations
-			scroll_text.configure(state='normal')
-			scroll_text.insert(tk.END, "\nMissing data identified, see red highlights in output.\n")
-			scroll_text.see(tk.END)
-			scroll_text.configure(state = 'disabled')
-		else:
-			# Display configurations
-			scroll_text.configure(state='normal')
-			scroll_text.insert(tk.END, "\nNo missing data identified.\n")
-			scroll_text.see(tk.END)
-			scroll_text.configure(state = 'disabled')
 		
 		# Display configurations
-		scroll_text.configure(state='normal')
-		scroll_text.insert(tk.END, "\nProcess Complete, opening output file.\n\n")
-		scroll_text.see(tk.END)
-		scroll_text.configure(state = 'disabled')
+		self.display.write("\nProcess Complete, opening output file.\n\n")
 		
 		# open output timesheet
+		import subprocess
 		process = subprocess.Popen(f'explorer "{os.path.abspath(self.Master_file_path)}"')
 		
 		## Block to allow duplicate deletion if duplicate rows exist
 		restart = True
-		if len(self.duplicate_row_list) != 0: #if there is a duplicate
+		if self.duplicate_rows: #if there is a duplicate
+			duplicate_rows_text = self.duplicates_text()
 			while restart: #while loop used for if user does not close output file they can try deletion again
-				duplicate_rows_text = ", ".join(str(item) for item in self.duplicate_row_list)
-				result = messagebox.askquestion("Duplicates found.", f"Duplicate rows found: {duplicate_rows_text}. Would you like to delete them?")
+				result = messagebox.askquestion("Duplicates found.", f"Duplicates found in {duplicate_rows_text}. Would you like to delete them?")
 				if result == "yes": #user clicked Yes on messagebox
 					messagebox.showinfo("Attention", "Please close the output excel file before pressing OK.")
-					check = self.delete_duplicates(self.Master_file_path) #delete duplicates, check is true false flag for master file open
+					check = self.delete_duplicates(self.master) #delete duplicates, check is true false flag for master file open
 					# Display configurations
 					if check:
-						scroll_text.configure(state='normal')
-						scroll_text.insert(tk.END, f"Deletion Complete, you deleted rows: {duplicate_rows_text}.\nReopening output sheet.\n")
-						scroll_text.see(tk.END)
-						scroll_text.configure(state = 'disabled')
+						self.display.write(f"Deletion Complete, you deleted {duplicate_rows_text}.\nReopening output sheet.\n")
 						restart = False #break loop
 						process = subprocess.Popen(f'explorer "{os.path.abspath(self.Master_file_path)}"')
 					else:
@@ -284,10 +928,374 @@ class MyClass:
 				else: #user pressed No, break loop
 					restart = False
 					
+		# Display the master load and save counts for the run and end the session
+		self.display.write(self.master.summary())
+		self.master.close()
+		
 		# Reset buttons
 		timesheet_button.config(state = tk.ACTIVE)
 		instructions_button.config(state = tk.ACTIVE)
+	
+	def run_pipeline(self, master_file_path, timesheet_file_paths, sheet_name = None):
+		"Runs the merge, sort and duplicate check for the master and timesheets and saves the master once. Used by the window and the headless batch mode. Returns False if the master could not be used or saved"
+		#param sheet_name sends every row to that sheet, by default each row goes to the sheet for the month of its date
+		# resets master varaibles to none before each new request
+		self.duplicate_rows = {}
+		self.formatted_rows = []
+		self.rows_to_insert = []
+		self.imported_rows = {}
+		self.written_row_ids = set()
+		self.violations = {}
+		self.style_table = StyleTable()
+		self.master = None
+		self.Master_file_path = master_file_path
+		self.Master_sheet_name = sheet_name
+		self.fixed_sheet_name = sheet_name
+		self.timer = RunTimer(master_file_path)
+		
+		# Start the master workbook session, the master is loaded once here and shared by every phase
+		self.timer.phase("open master")
+		self.master = MasterWorkbook(self.Master_file_path)
 		
+		# Test open master file path using helper method
+		result,text = self.test_open_file(self.Master_file_path, self.fixed_sheet_name)
+		if not result:
+			self.display.write(text) #prints the error message
+			return False
+			
+		# Build the approver directory once for the whole run, or read it from the cache if the master is unchanged
+		self.timer.phase("approver directory")
+		self.approvers = ApproverDirectory(self.Master_file_path)
+		self.approvers.load(self.master)
+		
+		# the store is written in one transaction that is only committed once the master is saved
+		self.store = TimesheetStore(self.store_path) if self.store_path else None
+		
+		# go through all the timesheet file paths and add to self.rows_to_insert, i and num_paths used for progress updates
+		text_list = self.approvers.collision_messages() #used to store all error messages to print after run, starts with approver initials that collide
+		approved_paths = [timesheet for timesheet in timesheet_file_paths if check_file_name(timesheet)]
+		
+		# the import ledger skips timesheets already imported unchanged and gives the old rows of changed ones to replace
+		self.timer.phase("ledger check")
+		self.ledger = ImportLedger(self.Master_file_path)
+		self.ledger.load()
+		already_imported = set()
+		changed_timesheets = [] #their old rows are replaced once they have parsed
+		rows_missing = set() #unchanged timesheets whose rows are no longer all in the master, imported again like a changed one
+		sheet_keys = {} #sheet name -> columns B to K of its rows, read from the loaded master once a timesheet needs the sheet
+		def keys_on_sheet(sheet_name):
+			if sheet_name not in sheet_keys:
+				sheet_keys[sheet_name] = sheet_row_keys(self.master.load(), sheet_name)
+			return sheet_keys[sheet_name]
+		if self.use_ledger:
+			paths_to_parse = []
+			for timesheet in approved_paths:
+				status = self.ledger.status(timesheet)
+				if status == "unchanged" and self.ledger.rows_missing(timesheet, keys_on_sheet):
+					rows_missing.add(timesheet)
+					status = "changed"
+				if status == "unchanged":
+					already_imported.add(timesheet)
+					continue
+				if status == "changed":
+					changed_timesheets.append(timesheet)
+				paths_to_parse.append(timesheet)
+			approved_paths = paths_to_parse
+		
+		open_errors = {} #error message for each timesheet that could not be opened
+		self.timer.phase("parse timesheets", timesheets = len(approved_paths))
+		if self.worker_count > 1 and len(approved_paths) > 1:
+			# parse across worker processes, rows are gathered back in selection order
+			open_errors = self.run_timesheets_parallel(approved_paths)
+		else:
+			for i, timesheet in enumerate(approved_paths):
+				with self.timer.span("timesheet", file = os.path.basename(timesheet)):
+					result, text, timesheet_data = open_timesheet(timesheet) #opens and reads the timesheet once, or gives the error message
+					if result: #if sheet okay run timesheet
+						text = self.run_timesheet(timesheet, i, len(approved_paths), timesheet_data)
+						result = not text
+				if not result: #else keep error message to print
+					open_errors[timesheet] = text
+		
+		# changed timesheets that parsed replace the rows they added last time, one that failed to open keeps its old rows
+		replaced_rows = {} #sheet name -> rows changed timesheets added there last time
+		for timesheet in changed_timesheets:
+			if timesheet in self.imported_rows:
+				for old_sheet_name, old_rows in self.ledger.old_rows(timesheet).items():
+					replaced_rows.setdefault(old_sheet_name, []).extend(old_rows)
+		
+		# error messages in the order the timesheets were selected
+		for timesheet in timesheet_file_paths:
+			if not check_file_name(timesheet):
+				text_list.append(f"\n[UNAPPROVED] File '{os.path.basename(timesheet)}' is not usable because it is not approved and doesn't match the naming convention.\n")
+			elif timesheet in already_imported:
+				text_list.append(f"\n[ALREADY IMPORTED] File '{os.path.basename(timesheet)}' was imported before and has not changed, it was skipped.\n")
+			elif timesheet in open_errors:
+				text_list.append(open_errors[timesheet])
+			elif timesheet in rows_missing:
+				text_list.append(f"\n[IMPORTED AGAIN] File '{os.path.basename(timesheet)}' was imported before but some of its rows are no longer in the master, it was imported again.\n")
+		
+		# Display all error messages
+		for message in text_list:
+			self.display.write(message)
+		self.display.write("\n")
+		
+		#Display configurations
+		self.display.status("Data gathered, organizing ...") 
+		self.display.update()
+		
+		# split the new rows by the month sheet they go to, a batch can cover several months
+		self.timer.phase("route rows")
+		new_rows = self.route_rows(self.remove_rows_with_empty_values(self.rows_to_insert))
+		sheet_names = set(new_rows) | set(replaced_rows)
+		if not sheet_names:
+			# nothing to add, the sheet of the first timesheet is still checked for duplicates
+			sheet_names = {self.fixed_sheet_name or self.get_sheet_name(timesheet_file_paths[0])}
+		
+		# each month sheet is merged, sorted and checked on its own in the same loaded workbook
+		for month_sheet_name in sorted(sheet_names, key=month_sort_key):
+			self.merge_sheet(month_sheet_name, new_rows.get(month_sheet_name, []), replaced_rows.get(month_sheet_name, []))
+		
+		# Save the master once now that every sheet has been merged, the last point a cancel stops the run
+		self.display.update()
+		self.timer.phase("save master")
+		try:
+			self.master.save()
+			self.approvers.restamp()
+		except PermissionError:
+			self.timer.phase(None)
+			self.timer.save()
+			if self.store is not None:
+				self.store.rollback()
+				self.store.close()
+			self.display.write("The output file you are trying to use is currently open. Please close the file and try again.\n")
+			return False
+		if self.store is not None:
+			self.timer.phase("store commit")
+			self.display.write(self.store.commit())
+			self.store.close()
+		
+		# record what each timesheet added to each sheet now that the master holds it
+		self.timer.phase("ledger save")
+		for timesheet, records in self.imported_rows.items():
+			written = [record for record in records if id(record) in self.written_row_ids] #rows dropped by dedupe on ingest belong to another timesheet
+			self.ledger.record(timesheet, {row_sheet_name: [duplicate_key(record) for record in rows] for row_sheet_name, rows in self.route_rows(written).items()})
+		self.ledger.save()
+		self.timer.phase(None)
+		self.timer.save()
+		if not self.duplicate_rows:
+			self.display.write("No duplicates found.\n") 
+		
+		# Report the rows that failed a check
+		if self.violations:
+			self.display.write("\nData problems identified, see red highlights in output:\n" + self.violations_text())
+		else:
+			self.display.write("\nNo data problems identified.\n")
+		self.display.write(self.timer.summary())
+		return True
+	
+	def watch_folder(self, master_file_path, folder, settle_seconds = 5.0, poll_seconds = 10.0, batch_size = 50, ready_checks = 6):
+		"Runs until stopped with Ctrl+C, importing approved timesheets into the master as they are dropped into folder. Files are gathered into small batches once the folder has been quiet for settle_seconds, each batch is one run_pipeline with one save"
+		#param batch_size is the most timesheets imported in one run, the rest go in the next batch
+		#param ready_checks is how many times a settled file can fail file_is_ready before it is reported and left until it changes again
+		watcher = FolderWatcher(folder, poll_seconds)
+		self.display.write(f"Watching {folder} for approved timesheets{' with inotify' if watcher.inotify_fd is not None else ''}, press Ctrl+C to stop.\n")
+		pending = {} #path -> (size and modified time, when it last changed)
+		not_ready = {} #path -> failed file_is_ready checks since it settled
+		try:
+			while True:
+				now = time.monotonic()
+				for path, stamp in watcher.scan().items():
+					pending[path] = (stamp, now)
+					not_ready.pop(path, None)
+				
+				# files deleted or moved away before they were imported are forgotten
+				for path in [path for path in pending if not os.path.exists(path)]:
+					pending.pop(path)
+					not_ready.pop(path, None)
+				
+				# a file is taken once it stopped changing for settle_seconds, is whole and no one has it open
+				ready = []
+				for path, (stamp, changed) in sorted(pending.items()):
+					if now - changed < settle_seconds:
+						continue
+					if file_is_ready(path, stamp):
+						ready.append(path)
+						continue
+					not_ready[path] = not_ready.get(path, 0) + 1
+					if not_ready[path] >= ready_checks:
+						# e.g. not an xlsx or a ~$ lock file left behind, the scan brings it back once the file changes
+						self.display.write(self.not_ready_text(path))
+						pending.pop(path)
+						not_ready.pop(path)
+				if ready:
+					# files the ledger already has unchanged, e.g. everything in the folder when the watcher starts, are dropped without a run
+					ledger = ImportLedger(master_file_path)
+					ledger.load()
+					for path in [path for path in ready if os.path.exists(path) and ledger.status(path) == "unchanged"]:
+						pending.pop(path)
+						not_ready.pop(path, None)
+						ready.remove(path)
+				
+				# debounce, nothing is imported while files are still arriving unless a whole batch is ready
+				quiet = all(now - changed >= settle_seconds for stamp, changed in pending.values())
+				failed = False
+				if ready and (quiet or len(ready) >= batch_size):
+					batch = ready[:batch_size]
+					self.display.write(f"\nImporting {len(batch)} timesheets from {folder} ...\n")
+					try:
+						imported = self.run_pipeline(master_file_path, batch)
+					except Exception as e:
+						# the watcher keeps going, the batch is dropped so the same files don't stop it again on every poll
+						self.display.write(f"\nThe batch stopped with an error: {e}\n")
+						imported = True
+					if imported:
+						for path in batch:
+							pending.pop(path)
+							not_ready.pop(path, None)
+					else:
+						failed = True #the master is open or unusable, the batch stays pending and is tried again after the next poll
+					if self.master is not None:
+						self.display.write(self.master.summary())
+						self.master.close()
+				watcher.wait(settle_seconds if pending and not failed else poll_seconds)
+		except KeyboardInterrupt:
+			self.display.write("Stopped watching.\n")
+		finally:
+			watcher.close()
+	
+	def not_ready_text(self, file_path):
+		"Message for a watched file that never became ready to import, with the open error it gives if it has one"
+		try:
+			precheck_workbook(file_path)
+			error = PermissionError("still held by another program")
+		except Exception as e:
+			error = e
+		return open_error_text(file_path, error) + "It is skipped until the file changes.\n"
+	
+	def route_rows(self, rows):
+		"Splits new rows by the master sheet they go to, the sheet for the month of each row's date unless the run set one sheet. Returns sheet name -> rows"
+		rows_by_sheet = {}
+		for row in rows:
+			row_sheet_name = self.fixed_sheet_name or month_sheet_name(row.date_ordinal)
+			rows_by_sheet.setdefault(row_sheet_name, []).append(row)
+		return rows_by_sheet
+	
+	def merge_sheet(self, sheet_name, new_rows, replaced_rows):
+		"Merges one month sheet. Reads its rows, drops rows replaced by changed timesheets, merges in the new rows, checks for duplicates and rewrites the sheet in the session workbook"
+		self.Master_sheet_name = sheet_name
+		
+		#Initial Display
+		self.display.status(f"Accessing existing data in {sheet_name} ...") 
+		self.display.update() #lets the window draw, or stops here if the run was cancelled
+		
+		# get the existing formatted rows from the sheet
+		self.timer.phase("extract_data_with_formatting", sheet = sheet_name)
+		self.formatted_rows = self.extract_data_with_formatting(self.master, sheet_name)
+		self.display.status(f"Accessing existing data in {sheet_name} ... ...") 
+		self.display.update()
+		
+		# dates become MM/DD/YYYY text for sorting, on the rows in memory and on just those date cells of the sheet
+		self.timer.phase("normalize_dates", sheet = sheet_name)
+		normalize_dates(self.formatted_rows, self.master.sheet(sheet_name))
+		
+		# remove empty rows from the existing data rows, the new rows were filtered before routing
+		self.timer.phase("replace and dedupe", sheet = sheet_name, new_rows = len(new_rows))
+		existing_rows = self.remove_rows_with_empty_values(self.formatted_rows)
+		
+		# changed timesheets replace the rows they added last time instead of duplicating them
+		if replaced_rows:
+			existing_rows, removed = self.remove_replaced_rows(existing_rows, replaced_rows)
+			if removed:
+				self.display.write(f"Replaced {removed} rows from changed timesheets in {sheet_name}.\n")
+		
+		# dedupe on ingest, incoming rows already in the master are dropped so the master rows and their highlights stay
+		if self.dedupe_on_ingest:
+			new_rows, skipped = self.drop_rows_already_present(existing_rows, new_rows)
+			if skipped:
+				self.display.write(f"Skipped {skipped} incoming rows already in {sheet_name}.\n")
+		
+		self.written_row_ids.update(map(id, new_rows))
+		
+		# only the new rows are checked, rows already in the master were checked on the run that added them
+		self.timer.phase("validate", sheet = sheet_name, new_rows = len(new_rows))
+		problems = RowValidator(self.validation_rules).validate(new_rows, sheet_name)
+		gap_style = self.gap_style()
+		for record in new_rows:
+			record.gap_style = gap_style if record.gap_columns else None
+		
+		# update the status line, the messages above stay in the text box
+		self.timer.phase("merge and sort", sheet = sheet_name, new_rows = len(new_rows))
+		self.display.status(f"Organizing {sheet_name} ...") 
+		self.display.update()
+		
+		if self.incremental_merge and self.rows_are_sorted(existing_rows):
+			# the master is already in name and date order from the last run, so only the new rows are sorted and merged in
+			self.combined_rows = self.merge_sorted_rows(existing_rows, new_rows)
+			self.display.status(f"Organizing {sheet_name} ... ...") 
+			self.display.update()
+		else:
+			# Combine the existing and new data rows
+			self.combined_rows = self.combine_data_with_formatting(existing_rows, new_rows)
+			self.display.status(f"Organizing {sheet_name} ... ...") 
+			self.display.update()
+			
+			# Sort the rows
+			self.sort_combined_rows()
+		
+		self.display.status(f"Organizing {sheet_name} ... ... ...") 
+		self.display.update()
+		
+		# display configurations
+		self.display.write(f"Checking for duplicates in {sheet_name} ... \n") 
+		self.display.update()
+		
+		#check for duplicates on the combined rows in memory before anything is written
+		self.timer.phase("check_duplicates", sheet = sheet_name)
+		self.check_duplicates(self.combined_rows, sheet_name)
+		self.display.update()
+		
+		# the problem report gives each new row's place on the sheet
+		if problems:
+			row_numbers = {id(row): row_idx for row_idx, row in enumerate(self.combined_rows, start = 4)}
+			self.violations[sheet_name] = sorted((row_numbers[id(record)], texts) for record, texts in problems)
+		
+		#rewrite combined rows to the sheet, starting at the first row that changed. No save here, run_pipeline saves once after every sheet
+		self.timer.phase("print_to_excel", sheet = sheet_name, rows = len(self.combined_rows))
+		self.print_to_excel(self.combined_rows, self.first_changed_row(self.formatted_rows, self.combined_rows))
+		
+		# payroll totals, worked out again from the merged rows so edits made to the sheet in Excel are counted too
+		if self.payroll_summary:
+			self.timer.phase("payroll rollup", sheet = sheet_name)
+			self.write_rollup(sheet_name, self.combined_rows)
+		elif summary_sheet_name(sheet_name) in self.master.workbook.sheetnames:
+			# a summary left from an earlier run would be out of date
+			del self.master.workbook[summary_sheet_name(sheet_name)]
+		
+		# the store gets the sheet as it is now, rows added or deleted in Excel or by runs without the store are caught up too
+		if self.store is not None:
+			self.timer.phase("store", sheet = sheet_name)
+			self.store.remove_rows(replaced_rows)
+			self.store.add_rows(sheet_name, existing_rows, "master") #rows already stored are left as they are
+			new_row_ids = set(map(id, new_rows))
+			for timesheet, records in self.imported_rows.items():
+				self.store.add_rows(sheet_name, [record for record in records if id(record) in new_row_ids], os.path.basename(timesheet))
+			self.store.prune_sheet(sheet_name, [duplicate_key(row) for row in self.combined_rows])
+		
+		self.timer.phase(None)
+		self.display.update()
+		
+	def write_rollup(self, sheet_name, rows):
+		"Writes the payroll summary sheet of a month sheet with the totals of rows, all the rows of the sheet"
+		workbook = self.master.load()
+		summary_name = summary_sheet_name(sheet_name)
+		rollup = PayrollRollup()
+		rollup.add_rows(rows)
+		if summary_name not in workbook.sheetnames:
+			# the summary goes right after its month sheet
+			workbook.create_sheet(title = summary_name, index = workbook.sheetnames.index(sheet_name) + 1)
+		rollup.write(workbook[summary_name], sheet_name)
+	
 	def get_sheet_name(self, timesheet_path):
 		"Helper Method to get the sheet name to extract formatted data"
 		file_date_str = timesheet_path.split("_")[-1].split(" ")[1]
@@ -298,83 +1306,28 @@ class MyClass:
 	
 	def test_open_file(self, file_path, sheet_name = None): 
 		"this method takes in a file_name and tests to see if there are any issues with it"
-		#param sheet_name defaults to None unless set, this method can be used for master and timesheet files
+		#param sheet_name is a master sheet to create if it is missing. Used for the master, timesheets go through open_timesheet which reads them in the same load
+		#for the master the workbook is loaded through the session so this load is the only one of the run
 		text = "" #define string for error message
 		# Load the workbook
 		try:
-			workbook = openpyxl.load_workbook(file_path)
+			if self.master is not None and file_path == self.master.file_path:
+				workbook = self.master.load()
+			else:
+				import openpyxl
+				workbook = openpyxl.load_workbook(file_path)
 			if sheet_name is not None and sheet_name not in workbook.sheetnames: #if name provided and does not exist, create it
-				new_sheet = workbook.create_sheet(title = sheet_name)
+				new_sheet = workbook.create_sheet(title = sheet_name) #kept since the session saves the workbook at the end
 				text = f"{sheet_name} not in the Output file path. It has been created."
 			return True, text #good result
-		except PermissionError:
-			#file is open
-			if sheet_name is not None:
-				text = "The output file you are trying to use is currently open. Please close the file and try again.\n"
-			else:
-				text = "\n[OPEN FILE] " + os.path.basename(file_path) + " is currently open. Please close the file and try again.\n"
-			return False, text #bad result
-		except ValueError as e:
-			#file cannot be read
-			text = "\n[UNREADABLE] Unable to read workbook: " + os.path.basename(file_path) + ".\nThis file is unusable and must be entered manually.\n"
-			return False, text #bad result
 		except Exception as e:
-			#generic exception
-			text = f"\n[UNKNOWN ERROR] An error occurred while processing the file: {os.path.basename(file_path)}\nError details: {e}\nPlease check the file or enter data manually.\n"
-			return False, text #bad result
+			#file is open, unreadable or some other error, open_error_text gives the message
+			return False, open_error_text(file_path, e, is_master = True) #bad result
 	
-	def read_rows(self, file_path):
-		"This converts the dates to strings of the master file before doing anything else"
-		# open the file and sheet
-		wb = openpyxl.load_workbook(file_path)
-		sheet = wb[self.Master_sheet_name]
-
-		# Initialize array to store rows
-		rows = []
-
-		# Initialize an array to store the dates
-		raw_dates = []
-
-		# Go through rows starting from row 4
-		for row_idx, row in enumerate(sheet.iter_rows(min_row=4, values_only=True), start =4):
-			# Extract the date from column E (index 4)
-			date = row[4]
-
-			# Check if the date is not None and not blank
-			if date is not None and not str(date).isspace():
-				# Convert the date to a string in the desired format (MM/DD/YYYY)
-				if isinstance(date, datetime):
-					date_str = date.strftime("%m/%d/%Y")
-				else:
-					date_str = str(date)
-
-				raw_dates.append(date_str)
-
-			# Check if any cell in the row has a value (not None and not blank)
-			if any(cell_value and not str(cell_value).isspace() for cell_value in row):
-				if row[4] is not None and row[1] is not None and row[10] is not None:
-					if not (str(row[4]).isspace() or str(row[1]).isspace() or str(row[10]).isspace()):
-						# Replace the date value in column E with the corresponding string from raw_dates
-						if len(raw_dates) > 0:
-							row = list(row)
-							row[4] = raw_dates.pop(0)
-							rows.append(tuple(row))
-								
-								 # Write the modified row back to the sheet
-						for col_idx, cell_value in enumerate(row, start=1):
-							sheet.cell(row=row_idx, column=col_idx, value=cell_value)
-
-		# Save the modified Excel file
-		wb.save(file_path)
-		return rows
-
-	def extract_data_with_formatting(self, file_path, sheet_name):
-		"This method extracts the existing data with all formatting and saves it in rows_with_formatting"
-		# Load the Excel workbook
-		workbook = load_workbook(file_path)
-
-		# Select the specified sheet
-		sheet = workbook[sheet_name]
+	def extract_data_with_formatting(self, master, sheet_name):
+		"This method extracts the existing data with all formatting and saves it in rows_with_formatting. Formats are held as IDs into self.style_table"
+		# Select the specified sheet from the loaded master session
+		sheet = master.sheet(sheet_name)
 
 		# Initialize the array to store rows
 		rows_with_formatting = []
@@ -383,310 +1336,155 @@ class MyClass:
 		for row in sheet.iter_rows(min_row=4, max_row=sheet.max_row, values_only=False):
 			row_data = []
 			for cell in row:
-				cell_value = cell.value
-				# copy all existing formatting from the extracted data
-				cell_formatting = {
-					"font": cell.font.copy(),
-					"fill": cell.fill.copy(),
-					"border": cell.border.copy(),
-					"alignment": cell.alignment.copy(),
-					"number_format": cell.number_format,
-				}
-				row_data.append((cell_value, cell_formatting))
+				# keep the existing formatting as an ID, identical formats share one entry in the style table
+				row_data.append((cell.value, self.style_table.intern_cell(cell)))
 			rows_with_formatting.append(row_data)
 
-		return rows_with_formatting #contains tuple with cell_value and cell_formatting
-	
-	def print_to_excel(self, rows_with_formatting):
-		"Prints the rows with formatting to the master Excel sheet"
-		# Open the master file and select working sheet
-		wb = openpyxl.load_workbook(self.Master_file_path)
-		sheet = wb[self.Master_sheet_name]
-		
-		# Clear existing data from rows 4 onwards including formatting
-		for row_index in range(4, sheet.max_row + 1):
-			for col_index in range(1, sheet.max_column + 1):
-				sheet.cell(row=row_index, column=col_index).value = None
-				# Clear formatting (highlight)
-				sheet.cell(row=row_index, column=col_index).fill = PatternFill(start_color='FFFFFF', end_color='FFFFFF', fill_type='solid')
-				sheet.cell(row=row_index, column=col_index).font = Font()
-				sheet.cell(row=row_index, column=col_index).alignment = Alignment()
-				# Reset the border to the default style (thin grey line)
-				default_border = Border(left=Side(style='thin', color='FFC0C0C0'),
-										right=Side(style='thin', color='FFC0C0C0'),
-										top=Side(style='thin', color='FFC0C0C0'),
-										bottom=Side(style='thin', color='FFC0C0C0'))
-				sheet.cell(row=row_index, column=col_index).border = default_border
-				
-		# Loop through rows and print data with formatting
-		for row_idx, row in enumerate(rows_with_formatting, start=4):
-			for col_idx, (cell_value, cell_formatting) in enumerate(row, start=1):
-				# Write cell value to the new sheet
-				sheet.cell(row=row_idx, column=col_idx, value=cell_value)
-
-				if cell_formatting is not None:
-					# Apply formatting to the cell if cell_formatting is not None
-					new_cell = sheet.cell(row=row_idx, column=col_idx)
-					for key, value in cell_formatting.items():
-						setattr(new_cell, key, value)
-
-		# Save the modified workbook
-		wb.save(self.Master_file_path)
-		
-	def display_instructions(self):
-		"This method prints instructions for operating this program to the user on the scrolled text window"
-		scroll_text.configure(state='normal')
-		scroll_text.delete('1.0', tk.END) #clear
-		scroll_text.insert(tk.END, "How to use this program:\n\nBEFORE USING:\nEnsure all timesheets have no data lines 3 empty rows or more below the previous data line.\nData with more than 2 empty rows above it will not be entered.\n\nBegin by pressing the 'Select output file and timesheets' button.\nThis will bring up a window that allows you to select files.\n\nFirst select the output file where you want the data to be entered.\nPress the 'Open' button.\n\nNext it will bring up a new window where you will select all of the timesheets to include.\nPress the 'Open' button once you have selected all the timesheets you want to include.\n\nPlease only select timesheets to insert from the same month.\n\nThe program will now gather the data and organize it in your selected output file.\nIt will then identify duplicate rows (if any exist) and give you the option to delete them.\nIt will also look for data gaps and highlight them in red.\nIt will not highlight cells with missing data that already have highlights.\n\nContact James Schroeder at JWI if there are any issues.\n\nEnjoy!") 
-		scroll_text.configure(state = 'disabled')
+		return rows_with_formatting #contains tuple with cell_value and style ID
 	
-	def run_timesheet(self,file_path, i, num_paths):
-		"This is the driving method that runs a singular timesheet collects all the data and writes it to the master excel sheet"
-		# Clear display at beginning of program so progress updates in one line
-		scroll_text.configure(state='normal')
-		scroll_text.delete('1.0', tk.END) 
-		scroll_text.configure(state = 'disabled')
+	def print_to_excel(self, rows_with_formatting, first_row = 0):
+		"Prints the rows with formatting to the master Excel sheet. Rebuilds rows 4 onwards in one pass, header rows 1-3, column widths and the other sheets are left as they are"
+		#param first_row is the index of the first row that changed, the rows above it are already on the sheet and are not rewritten
+		from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
+		from openpyxl.cell.cell import Cell
+		# Select working sheet from the loaded master session
+		sheet = self.master.sheet(self.Master_sheet_name)
+		old_max_row = sheet.max_row
+		old_max_column = sheet.max_column
 		
-		#open timesheet
-		workbook = openpyxl.load_workbook(file_path)
+		# Work out the cleared format once (white fill, default font and alignment, thin grey border) on a scratch cell
+		cleared = Cell(sheet)
+		cleared.fill = PatternFill(start_color='FFFFFF', end_color='FFFFFF', fill_type='solid')
+		cleared.font = Font()
+		cleared.alignment = Alignment()
+		cleared.border = Border(left=Side(style='thin', color='FFC0C0C0'),
+								right=Side(style='thin', color='FFC0C0C0'),
+								top=Side(style='thin', color='FFC0C0C0'),
+								bottom=Side(style='thin', color='FFC0C0C0'))
+		cleared_style = cleared._style
 		
-		# Select the active sheet in timesheet file, not specified since timesheet file only has one sheet
-		sheet = workbook.active
-
-		# Read the week start date from cell G3
-		sunday_start = sheet['G3'].value
-		month_year = sunday_start.strftime("%B %Y") #month_year becomes sheet name in master file
-
-		# Calculate the dates for each day of the week
-		dates = []
-		for day_offset in range(7):
-			date = sunday_start + timedelta(days=day_offset)
-			dates.append(date.strftime("%m/%d/%Y"))
-
-		# Assign the dates to respective variables
-		Sunday, Monday, Tuesday, Wednesday, Thursday, Friday, Saturday = dates
-
-		# Read the name of the person
-		name = sheet['C3'].value
-
-		# Initialize a list to store the rows
-		rows = []
-
-		# Get the maximum row number
-		max_row = sheet.max_row
-
-		# Initialize a counter for empty work descriptions
-		empty_work_desc_counter = 0
-
-		# Iterate over the rows starting from row 13
-		for row in range(13, max_row + 1):
-			# Read the work description from column A
-			work_description = sheet['A' + str(row)].value
-			
-			# Read the note from column B
-			note = sheet['B' + str(row)].value
-			
-			# Get the code for the hours and convert to non coded language
-			pay_type_code = sheet['D' + str(row)].value
-			if pay_type_code == 'ST':
-				time_type = "Regular Hours"
-			elif pay_type_code == 'DT':
-				time_type = "Double Time"
-			elif pay_type_code == 'OT':
-				time_type = "Overtime"
-			else:
-				time_type = pay_type_code #unknown code stays the same (typo)
-			
-			##THIS LOOP STOPS SEARCHING AFTER 3 EMPTY ROWS OF WORK_DESCRIPTION. THIS IS A KEY LIMITING FEATURE##
-			if work_description is None:
-				# Increment the counter for empty work descriptions
-				empty_work_desc_counter += 1
-				
-				# Check if three consecutive empty work descriptions are encountered
-				if empty_work_desc_counter >= 3:
-					break
+		# Drop every existing cell from the first changed row down at once instead of clearing them one at a time
+		# sheet._cells is openpyxl's (row, column) -> cell store, the same one its delete_rows works on
+		cells = sheet._cells
+		for coordinate in [coordinate for coordinate in cells if coordinate[0] >= 4 + first_row]:
+			del cells[coordinate]
+		
+		# Stream the new rows in. Cells in the old data area get the cleared format first, same as clearing them did
+		last_row = max(old_max_row, len(rows_with_formatting) + 3)
+		for row_idx in range(4 + first_row, last_row + 1):
+			row = rows_with_formatting[row_idx - 4] if row_idx - 4 < len(rows_with_formatting) else []
+			in_old_rows = row_idx <= old_max_row
+			for col_idx in range(1, max(len(row), old_max_column if in_old_rows else 0) + 1):
+				if col_idx <= len(row):
+					cell_value, style_id = row[col_idx - 1]
 				else:
-					continue
-			
-			# Reset the counter for empty work descriptions
-			empty_work_desc_counter = 0
-			
-			# Read the hours for each day from Sunday to Saturday
-			hours = []
-			for day in range(5, 12):
-				cell_value = sheet.cell(row=row, column=day).value
-				hours.append(cell_value if cell_value is not None else 0)
-			
-			# Create a row array with the work description, note, and hours
-			row_data = [work_description, note, time_type] + hours
-			
-			# Append the row array to the list of rows
-			rows.append(row_data)
-
-		# Close the workbook
-		workbook.close()
+					cell_value, style_id = None, None
+				new_cell = Cell(sheet, row=row_idx, column=col_idx, value=cell_value)
+				if in_old_rows and col_idx <= old_max_column:
+					new_cell._style = copy.copy(cleared_style)
+				if style_id is not None:
+					# Apply formatting from the style table if the cell has one
+					self.style_table.apply(new_cell, style_id)
+				cells[(row_idx, col_idx)] = new_cell
+		# No save here, the session saves the master once after the duplicate check
 		
-		## At this point all timesheet data has been read from the sheet. Now program saves correct data and formatting to rows_to_insert ##
+	def display_instructions(self):
+		"This method prints instructions for operating this program to the user on the scrolled text window"
+		self.display.clear()
+		self.display.write("How to use this program:\n\nBEFORE USING:\nTimesheets in the standard layout (name in C3, week start in G3, data from row 13) are read in full.\nFor any other timesheet, data with more than 2 empty rows above it will not be entered.\n\nBegin by pressing the 'Select output file and timesheets' button.\nThis will bring up a window that allows you to select files.\n\nFirst select the output file where you want the data to be entered.\nPress the 'Open' button.\n\nNext it will bring up a new window where you will select all of the timesheets to include.\nPress the 'Open' button once you have selected all the timesheets you want to include.\n\nTimesheets from different months can be selected together, each row goes to the sheet for the month of its date.\n\nThe program will now gather the data and organize it in your selected output file.\nIt will then identify duplicate rows (if any exist) and give you the option to delete them.\nTick 'Skip rows already in the master' to leave out timesheet rows that are already in the output file.\nIt will also check the new rows for blank fields, unknown pay types, missing task codes, hours outside 0 to 24 and dates outside the sheet's month.\nThose cells are highlighted in red and the rows are listed when the run ends.\n\nContact James Schroeder at JWI if there are any issues.\n\nEnjoy!") 
+	
+	def run_timesheet(self,file_path, i, num_paths, timesheet_data = None):
+		"This is the driving method that runs a singular timesheet in this process, collects all the data and adds it to rows_to_insert. Returns the error message if the timesheet could not be parsed, else an empty string"
+		#param timesheet_data is what open_timesheet read, None reads the file here
+		text = ""
+		try:
+			self.insert_records(parse_timesheet(file_path, self.approvers.names, timesheet_data), file_path)
+		except Exception as e:
+			# e.g. a blank week start date, reported like a file that could not be opened instead of stopping the run
+			text = open_error_text(file_path, e)
+		self.show_progress(i, num_paths)
+		return text
+	
+	def export_month(self, master_file_path, sheet_name):
+		"Rewrites one month sheet of the master from the store in the master layout and saves the master, rows keep the formats they have on the sheet. Returns False if the master could not be used or saved, or the sheet no longer matches the store"
+		self.master = MasterWorkbook(master_file_path)
+		self.Master_file_path = master_file_path
+		self.Master_sheet_name = sheet_name
+		self.style_table = StyleTable()
+		result, text = self.test_open_file(master_file_path, sheet_name)
+		if not result:
+			self.display.write(text)
+			return False
 		
-		# Define the file path for the output workbook
-		new_file_path = self.Master_file_path
-
-		# Load the existing workbook or create a new one if it doesn't exist
-		new_workbook = load_workbook(new_file_path)
+		# the workbook is still the file people edit, rows changed or deleted in Excel since the store last saw the sheet would be lost
+		existing_rows = self.extract_data_with_formatting(self.master, sheet_name)
+		normalize_dates(existing_rows, self.master.sheet(sheet_name))
+		row_styles = {json.dumps(duplicate_key(row), default = str): [style_id for value, style_id in row] for row in self.remove_rows_with_empty_values(existing_rows)}
+		store = TimesheetStore(self.store_path)
+		if row_styles:
+			store_keys = store.sheet_keys(sheet_name)
+			only_sheet = len(row_styles.keys() - store_keys)
+			only_store = len(store_keys - row_styles.keys())
+			if only_sheet or only_store:
+				store.close()
+				self.display.write(f"{sheet_name} has {only_sheet} rows that are not in {os.path.basename(self.store_path)} and is missing {only_store} rows the store has, it was changed since a run last brought the store up to date. The sheet was not exported, import timesheets for {sheet_name} with --store first to catch the store up.\n")
+				return False
+		rows = store.month_rows(sheet_name, self.gap_style(), row_styles)
+		store.close()
 		
-		#Extract the master sheet name from the file name
-		file_date_str = file_path.split("_")[-1].split(" ")[1]
-		file_date = datetime.strptime(file_date_str, "%m%d%Y")
-		month_year = file_date.strftime("%B %Y")
-		self.Master_sheet_name = month_year
+		self.print_to_excel(rows)
+		if self.payroll_summary:
+			self.write_rollup(sheet_name, rows)
+		try:
+			self.master.save()
+		except PermissionError:
+			self.display.write("The output file you are trying to use is currently open. Please close the file and try again.\n")
+			return False
+		self.display.write(f"Exported {len(rows)} rows from {os.path.basename(self.store_path)} to {sheet_name}.\n")
+		return True
+	
+	def gap_style(self):
+		"Style ID of the red highlight for missing data"
+		from openpyxl.styles import PatternFill
+		red_fill = PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid')
+		return self.style_table.intern_formatting({"fill": red_fill})
+	
+	def insert_records(self, records, timesheet):
+		"Adds TimesheetRow records from parse_timesheet to rows_to_insert, they are checked and highlighted once they are routed to a sheet"
+		self.rows_to_insert.extend(records) #add the rows to the master list of rows to insert
+		self.imported_rows[timesheet] = records
+	
+	def show_progress(self, i, num_paths):
+		"Shows the timesheet progress on the status line"
+		progress_percentage = (i+1)/num_paths*100
+		self.display.status(f"Processing Timesheets ... {i+1}/{num_paths} {progress_percentage:.1f}%")
+		self.display.update() #lets the window draw, or stops here if the run was cancelled
+	
+	def run_timesheets_parallel(self, timesheet_paths):
+		"Runs run_timesheet_job for every timesheet across a process pool. Results are put back in selection order so the output matches a serial run. Returns the open error message of each failed timesheet"
+		from concurrent.futures import ProcessPoolExecutor, as_completed
+		num_paths = len(timesheet_paths)
+		results = [None] * num_paths
+		with ProcessPoolExecutor(max_workers = min(self.worker_count, num_paths)) as executor:
+			futures = {executor.submit(run_timesheet_job, timesheet, self.approvers.names): i for i, timesheet in enumerate(timesheet_paths)}
+			try:
+				for done, future in enumerate(as_completed(futures)):
+					results[futures[future]] = future.result()
+					self.show_progress(done, num_paths)
+			except RunCancelled:
+				executor.shutdown(cancel_futures = True) #timesheets not started yet are dropped
+				raise
 		
-		# Select the active sheet or create a new one if it doesn't exist
-		if month_year in new_workbook.sheetnames:
-			new_sheet = new_workbook[month_year]
-		else:
-			new_sheet = new_workbook.active
-			new_sheet.title = month_year
-
-		# Read the name of the person
-		name = sheet['C3'].value
-
-		# Extract approver initials 
-		removed_last_5 = file_path[:-5]
-		last_space_index = removed_last_5.rindex(" ")
-		approver_initials = removed_last_5[last_space_index:]
-		approver_initials = approver_initials[1:]
-		
-		# this block looks for names of approvers and connect with initials
-		if "Data Validation" in new_workbook.sheetnames:
-			initials_sheet = new_workbook["Data Validation"]
-			#goes to data validation sheet in file
-			approver_names = []
-			
-			approver_column = None
-			for cell in initials_sheet[1]:
-				if cell.value == "Approver":
-					# find the header Approver
-					approver_column = cell.column
-					break
-			
-			if approver_column is not None:
-				row_index = 1
-				while initials_sheet.cell(row=row_index + 1, column=approver_column).value is not None:
-					# go down through the list and add each name to the approver_names list
-					row_index += 1
-					cell_value = initials_sheet.cell(row=row_index, column=approver_column).value
-					approver_names.append(cell_value)
-			# break each approver name into initials and create matched array of initials
-			approver_initials_list = []
-			for Name in approver_names:
-				name_parts = Name.split()
-				initials = name_parts[0][0] + name_parts[-1][0]
-				approver_initials_list.append(initials)
-			# Check for a match and replace with full name by matched index
-			if approver_initials in approver_initials_list:
-				index = approver_initials_list.index(approver_initials)
-				approver_initials = approver_names[index]
-
-		# Iterate over the dates and rows
-		for date in dates:
-			# Iterate over the rows
-			for row_data in rows:
-				# Extract the work description, note, and hours
-				work_description, note, time_type, hours = row_data[0], row_data[1], row_data[2], row_data[3:]
-				
-				# Get the index of the current date in the dates list
-				date_index = dates.index(date)
-				
-				# Code for second third column data
-				code = work_description.split("-")[0]
-				col_2 = "ISTHA" + code + "-BR16"
-				col_3 = "ISTHA Task " + code
-				if code == "4":
-					col_3 = col_3 + " (Professional SVS Eng)"
-				elif code == "5":
-					col_3 = col_3 + " (UR Supp Splicing)"
-				elif code == "2C":
-					col_3 = col_3 + " (Prof SVS PM)"
-				elif code == "11":
-					col_3 = col_3 + " (Watch/Protect)"
-				elif code == "2C":
-					col_3 = col_3 + " (Prof SVS PM)"
-				
-				# Get the hours worked for the current date
-				hours_worked = hours[date_index]
-				
-				# Skip rows with zero hours
-				if hours_worked == 0:
-					continue
-				
-				# Mini method to find empty data
-				def is_none_or_spaces(s):
-					if s is None or str(s).isspace():
-						self.found_gaps = True #mark gaps found as true for correct user display
-						return True
-					return False
-				
-				# Create a red fill for empty cells
-				red_fill = PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid')
-				
-				# Determine if the cell needs highlighting by if the cell is blank or just spaces
-				name_formatting = {"fill": red_fill} if is_none_or_spaces(name) else None
-				note_formatting = {"fill": red_fill} if is_none_or_spaces(note) else None
-				work_description_formatting = {"fill": red_fill} if is_none_or_spaces(work_description) else None
-				hours_worked_formatting = {"fill": red_fill} if is_none_or_spaces(hours_worked) else None
-				
-				weekNum = 11 + self.get_week_of_month(date) #for correct hours column formatting by weeks
-				
-					# Create a row to insert with the cell values and None for cell formatting
-				row_to_insert = [
-					("", None),
-					(name, name_formatting),
-					(col_2, None),
-					(col_3, None),
-					(date, None),
-					(note, note_formatting),
-					(work_description, work_description_formatting),
-					(time_type, None),
-					(approver_initials, None),
-					("Approved", None),
-					(hours_worked, hours_worked_formatting)
-				]
-				#This code used to correctly format the hours by week columns with blank data for correct formatting
-				if weekNum == 12:
-					row_to_insert.append((hours_worked, None))
-				elif weekNum == 13:
-					row_to_insert.append((None, None))
-					row_to_insert.append((hours_worked, None))
-				elif weekNum == 14:
-					row_to_insert.append((None, None))
-					row_to_insert.append((None, None))
-					row_to_insert.append((hours_worked, None))
-				elif weekNum == 15:
-					row_to_insert.append((None, None))
-					row_to_insert.append((None, None))
-					row_to_insert.append((None, None))
-					row_to_insert.append((hours_worked, None))
-				elif weekNum == 16:
-					row_to_insert.append((None, None))
-					row_to_insert.append((None, None))
-					row_to_insert.append((None, None))
-					row_to_insert.append((None, None))
-					row_to_insert.append((hours_worked, None))
-				
-				self.rows_to_insert.append(row_to_insert) #add the row to the master list of rows to insert
+		open_errors = {}
+		for timesheet, (result, text, records, wall, cpu) in zip(timesheet_paths, results):
+			self.timer.add("timesheet", wall, cpu, file = os.path.basename(timesheet), worker = True)
+			if result: #if sheet okay add its rows
+				self.insert_records(records, timesheet)
+			else: #else keep error message to print
+				open_errors[timesheet] = text
+		return open_errors
 		
-		# update the progress readout
-		progress_percentage = (i+1)/num_paths*100
-		progress_text = f"Processing Timesheets ... {i+1}/{num_paths} {progress_percentage:.1f}%\n"
-		scroll_text.configure(state = 'normal')
-		scroll_text.insert(tk.END, progress_text)
-		scroll_text.see(tk.END) #scroll to bottom
-		scroll_text.configure(state = 'disabled')
-		root.update() #yield control to main loop so that program prints updates and doesn't stall
 
-		# Close the master file sheet
-		new_workbook.close()
-		
 	def combine_data_with_formatting(self, existing_data, new_data):
 		"This method performs the operations to combine the data extracted from extract_data_with_formatting and run_timesheet with their respective highlights and other formatting"
 		# Create a dictionary to store the formatting for each cell in the existing data
@@ -730,87 +1528,671 @@ class MyClass:
 		
 	def sort_combined_rows(self):
 		"This method runs on combined_rows_with_formatting to sort the rows by name and date"
-		# Define a custom sorting function
-		def custom_sort_key(row_data):
-			# Extract the name, date, and hours from the row data
-			name = row_data[1][0]
-			date = row_data[4][0]
-			return (name, date)
-
 		# Sort the combined_rows using the custom sorting function
-		self.combined_rows.sort(key=custom_sort_key)
+		self.combined_rows.sort(key=row_sort_key)
+	
+	def rows_are_sorted(self, rows):
+		"Checks in one pass that rows are already in name and date order"
+		try:
+			return all(row_sort_key(rows[i]) <= row_sort_key(rows[i + 1]) for i in range(len(rows) - 1))
+		except TypeError:
+			return False #names or dates that can't be compared, the full sort will report it
+	
+	def merge_sorted_rows(self, existing_rows, new_rows):
+		"Incremental mode, sorts only the new rows and merges them into the already sorted existing rows. Gives the same order as sorting everything, existing rows stay ahead of new rows with the same name and date"
+		new_rows = sorted(new_rows, key=row_sort_key)
+		return list(heapq.merge(existing_rows, new_rows, key=row_sort_key))
+	
+	def first_changed_row(self, old_rows, new_rows):
+		"Index of the first row that is not the same row object as before, everything above it is already on the sheet"
+		for i, (old_row, new_row) in enumerate(zip(old_rows, new_rows)):
+			if old_row is not new_row:
+				return i
+		return min(len(old_rows), len(new_rows))
 
 	def get_week_of_month(self,date):
 		"this is a helper method that calculates the week of the month for the correct hours column formatting by week"
-		isOneMinus = False # flag to subtract one if month starts on a saturday
-		date_obj = datetime.strptime(date, "%m/%d/%Y") #convert to datetime object
-		first_day = datetime(date_obj.year, date_obj.month, 1) #find the first day
-		first_weekday = first_day.weekday() #then the weekday
-		if first_weekday == 5: #check if saturday
-			isOneMinus = True
-		adjusted_date = date_obj.day + first_weekday - 1
-		week_number = adjusted_date // 7 + 1 #calculates
-		if isOneMinus:
-			return week_number -1
-		else:
-			return week_number	
+		return get_week_of_month(date)
 
-	def check_duplicates(self, file_path):
-		"This method checks for duplicate rows and prints them out to the user. It deliberately selects inserted rows so as not to remove highlights"
-		wb = openpyxl.load_workbook(file_path)
-		sheet = wb[self.Master_sheet_name]
-		
-		# iter rows
-		rows = list(sheet.iter_rows(min_row =4, values_only=True))
-		
+	def check_duplicates(self, rows_with_formatting, sheet_name):
+		"This method checks the combined rows of one sheet for duplicates with a hash index and prints them out to the user. Row numbers are the sheet rows the rows are written to. It deliberately selects inserted rows so as not to remove highlights"
 		#create dictionary of saved rows and list of duplicates
 		saved_rows = {}
 		duplicates = []
 		first_dup = False #for formatting
-		scroll_text.configure(state='normal')
 		# go through rows
-		for row_index, row in enumerate(rows, start=4):
+		for row_index, row in enumerate(rows_with_formatting, start=4):
 			#only search for dups between col B and col K. This is so rows without the inputted weekly column hours aren't considered
-			key = tuple(row[1:11]) 
+			key = duplicate_key(row)
 			if key not in saved_rows: #store first occurance of everything
 				saved_rows[key] = row_index
 			else: #not first occurance means duplicate
 				if not first_dup:
-					scroll_text.insert(tk.END, "\n")
+					self.display.write("\n")
 					first_dup = True
 				duplicates.append(row)
-				scroll_text.configure(state='normal')
-				scroll_text.insert(tk.END, f"Row {row_index} is a duplicate of Row {saved_rows[key]}\n") #prints dup line and paired line
-				scroll_text.configure(state='disabled')
-				self.duplicate_row_list.append(row_index)
+				self.display.write(f"Row {row_index} is a duplicate of Row {saved_rows[key]}\n") #prints dup line and paired line
+				self.duplicate_rows.setdefault(sheet_name, []).append(row_index)
 				
 		#no duplicates found, formatting
 		if not duplicates:
-			scroll_text.insert(tk.END, "\n") 
-		scroll_text.configure(state='disabled')
+			self.display.write("\n") 
+	
+	def remove_replaced_rows(self, existing_rows, replaced_rows):
+		"Drops one master row for each old row of a changed timesheet. Returns the kept rows and how many were dropped"
+		to_remove = {}
+		for key in replaced_rows:
+			to_remove[key] = to_remove.get(key, 0) + 1
+		kept_rows = []
+		for row in existing_rows:
+			key = duplicate_key(row)
+			if to_remove.get(key, 0) > 0:
+				to_remove[key] -= 1
+			else:
+				kept_rows.append(row)
+		return kept_rows, len(existing_rows) - len(kept_rows)
+	
+	def drop_rows_already_present(self, existing_rows, new_rows):
+		"Dedupe on ingest, drops new rows whose columns B to K match a master row or an earlier new row. Returns the kept rows and how many were dropped"
+		seen = set(duplicate_key(row) for row in existing_rows)
+		kept_rows = []
+		for row in new_rows:
+			key = duplicate_key(row)
+			if key not in seen:
+				seen.add(key)
+				kept_rows.append(row)
+		return kept_rows, len(new_rows) - len(kept_rows)
 		
-	def delete_duplicates(self, file_path):
-		"This method opens an Excel file, deletes rows from self.duplicate_row_list, and moves other rows up. It returns True/False for if the master file was open"
-		# Load the workbook
+	def violations_text(self):
+		"One line per row that failed a check, e.g. May 2024 row 12: blank note, hours 30 not from 0 to 24"
+		return "".join(f"{sheet_name} row {row_number}: {', '.join(texts)}\n" for sheet_name in sorted(self.violations, key = month_sort_key) for row_number, texts in self.violations[sheet_name])
+	
+	def duplicates_text(self):
+		"Duplicate rows by sheet for the messages, e.g. May 2024 rows 6, 7; June 2024 rows 4"
+		return "; ".join(f"{sheet_name} rows " + ", ".join(str(row_index) for row_index in row_indexes) for sheet_name, row_indexes in self.duplicate_rows.items())
+	
+	def delete_duplicates(self, master):
+		"This method deletes rows from self.duplicate_rows in the session workbook, and moves other rows up. It returns True/False for if the master file was open"
+		# Use the workbook still held by the session, no reload needed
 		try:
-			wb = openpyxl.load_workbook(file_path)
-			sheet = wb[self.Master_sheet_name]
-
-			# Sort the duplicate_row_list in reverse order to delete rows from the end first
-			self.duplicate_row_list.sort(reverse=True)
-
-			# Delete rows in self.duplicate_row_list, no need to reformat since deletion doesn't empty rows but deletes them entirely
-			for row_index in self.duplicate_row_list:
-				sheet.delete_rows(row_index)
+			# Remove every duplicate row of each sheet in one pass, sheet.delete_rows per row shifts everything below each time
+			start = time.perf_counter()
+			removed = 0
+			with self.timer.span("delete_duplicates"):
+				for sheet_name, row_indexes in self.duplicate_rows.items():
+					removed += delete_rows_at_once(master.sheet(sheet_name), row_indexes)
+					if self.payroll_summary:
+						# the totals are worked out again from the rows left on the sheet
+						self.write_rollup(sheet_name, self.remove_rows_with_empty_values([[(value, None) for value in row] for row in master.sheet(sheet_name).iter_rows(min_row = 4, values_only = True)]))
+			self.display.write(f"Deleted {removed} duplicate rows in {time.perf_counter() - start:.2f}s.\n")
+			# rows are gone from the session workbook now, so a retry after a failed save only saves
+			self.duplicate_rows = {}
 			
-			# Save the modified workbook
-			wb.save(file_path)
+			# Save the modified workbook, the only save after the end of run save
+			with self.timer.span("save master", after = "delete_duplicates"):
+				master.save()
+			self.approvers.restamp()
+			self.timer.save()
 			return True
 		except PermissionError:
-			scroll_text.configure(state='normal')
-			scroll_text.insert(tk.END, "Master output file is currently open. Please close the file and try again.\n") 
-			scroll_text.configure(state = 'disabled')
+			self.display.write("Master output file is currently open. Please close the file and try again.\n") 
+			return False
+
+def row_sort_key(row_data):
+	"Sort key for a row, the name and the date as an ordinal"
+	if isinstance(row_data, TimesheetRow):
+		return (row_data.name, (row_data.date_ordinal, ""))
+	# Extract the name and date from the row data
+	name = row_data[1][0]
+	date = row_data[4][0]
+	return (name, date_sort_value(date))
+
+def duplicate_key(row_data):
+	"Columns B to K of a row, the values two rows must share to be duplicates"
+	if isinstance(row_data, TimesheetRow):
+		return row_data.key()
+	return tuple(row_data[col][0] if col < len(row_data) else None for col in range(1, 11))
+
+def normalize_dates(rows, sheet):
+	"Makes the dates in column E MM/DD/YYYY text on master rows read from row 4 down, in memory. The same date cells of the sheet get the text too, so the rows stay unchanged for first_changed_row and nothing else is rewritten. Returns how many dates changed"
+	changed = 0
+	for row_idx, row in enumerate(rows, start = 4):
+		if len(row) > 4:
+			value, style_id = row[4]
+			if value is not None and not str(value).isspace():
+				text = normalized_date(value)
+				if text != value:
+					row[4] = (text, style_id)
+					sheet.cell(row = row_idx, column = 5).value = text #keeps the cell's format, like rewriting it did
+					changed += 1
+	return changed
+
+@functools.lru_cache(maxsize=4096)
+def normalized_date(value):
+	"MM/DD/YYYY text for a date cell. Datetimes are formatted, text dates such as 5/6/2024 are zero padded and anything else is kept as its text"
+	if isinstance(value, (datetime, date)):
+		return value.strftime("%m/%d/%Y")
+	text = str(value)
+	try:
+		return datetime.strptime(text.strip(), "%m/%d/%Y").strftime("%m/%d/%Y")
+	except ValueError:
+		return text
+
+def sheet_row_keys(workbook, sheet_name):
+	"Columns B to K of every row of a master sheet from row 4 down with MM/DD/YYYY dates, the keys duplicate_key gives once the dates are normalized. Empty if the sheet is missing"
+	if sheet_name not in workbook.sheetnames:
+		return set()
+	keys = set()
+	for values in workbook[sheet_name].iter_rows(min_row=4, min_col=2, max_col=11, values_only=True):
+		if values[3] is not None:
+			values = values[:3] + (normalized_date(values[3]),) + values[4:]
+		keys.add(values)
+	return keys
+
+def delete_rows_at_once(sheet, row_indexes):
+	"Deletes all the given rows from sheet in one pass and moves the rows below up, cells keep their formatting. Returns the number of rows removed"
+	removed = sorted(set(row_indexes))
+	if not removed:
+		return 0
+	removed_set = set(removed)
+	cells = sheet._cells #(row, column) -> Cell, the same dict delete_rows moves cells around in
+	moved = {}
+	for key in [key for key in cells if key[0] >= removed[0]]: #rows above the first deleted row stay put
+		cell = cells.pop(key)
+		if key[0] in removed_set:
+			continue
+		cell.row = key[0] - bisect.bisect_left(removed, key[0]) #up by the number of deleted rows above it
+		moved[(cell.row, key[1])] = cell
+	cells.update(moved)
+	return len(removed)
+
+def file_hash(file_path):
+	"sha256 of a file's bytes, read in blocks without parsing the workbook"
+	digest = hashlib.sha256()
+	with open(file_path, "rb") as file:
+		for block in iter(lambda: file.read(1 << 20), b""):
+			digest.update(block)
+	return digest.hexdigest()
+
+def hidden_file_path(master_file_path, suffix):
+	"Path of a json file kept next to the master, e.g. .Master.xlsx.ledger.json for the suffix ledger"
+	folder, file_name = os.path.split(master_file_path)
+	return os.path.join(folder, "." + file_name + "." + suffix + ".json")
+
+def read_json_file(file_path, read):
+	"Loads a json file kept next to the master and returns read(contents), None if the file is missing, broken or read finds it does not fit"
+	try:
+		with open(file_path, "r") as json_file:
+			return read(json.load(json_file))
+	except (OSError, ValueError, KeyError, TypeError):
+		return None
+
+def write_json_file(file_path, contents, **dump_options):
+	"Writes a json file kept next to the master and hides it. The leading dot only hides it outside Windows, there it gets the hidden attribute. Returns False if it could not be written"
+	hide = sys.platform == "win32"
+	if hide:
+		import ctypes
+		FILE_ATTRIBUTE_HIDDEN = 0x2
+		FILE_ATTRIBUTE_NORMAL = 0x80
+		if os.path.exists(file_path):
+			ctypes.windll.kernel32.SetFileAttributesW(file_path, FILE_ATTRIBUTE_NORMAL) #Windows won't open a hidden file for writing
+	try:
+		with open(file_path, "w") as json_file:
+			json.dump(contents, json_file, **dump_options)
+	except OSError:
+		return False
+	if hide:
+		ctypes.windll.kernel32.SetFileAttributesW(file_path, FILE_ATTRIBUTE_HIDDEN)
+	return True
+
+def check_file_name(file_path):
+	"Checks that a timesheet file name says it was approved"
+	# Define the regular expression pattern to match "Approved" followed by two letters A-Z
+	pattern = r"Approved [A-Z]{2}"
+
+	# Extract the filename from the file path, basename handles both / and \ on windows
+	file_name = os.path.basename(file_path)
+
+	# Search for the pattern in the file name
+	match = re.search(pattern, file_name)
+
+	# If a match is found, return True, otherwise return False
+	return bool(match)
+
+def file_is_ready(file_path, stamp):
+	"True once a timesheet is completely written and closed: its size and modified time still match stamp, Excel has no ~$ lock file for it, it can be opened for writing (Windows refuses while another program holds it) and it is a whole xlsx zip"
+	import zipfile
+	try:
+		stat = os.stat(file_path)
+		if (stat.st_size, stat.st_mtime_ns) != stamp:
+			return False
+		if has_lock_file(file_path):
 			return False
+		with open(file_path, "r+b"):
+			pass
+		return zipfile.is_zipfile(file_path)
+	except OSError:
+		return False
+
+def has_lock_file(file_path):
+	"True if Excel's ~$ lock file for a workbook is next to it, Excel names it ~$ plus the file name and drops the first characters of long names"
+	folder, file_name = os.path.split(file_path)
+	return os.path.exists(os.path.join(folder, "~$" + file_name)) or os.path.exists(os.path.join(folder, "~$" + file_name[2:]))
+
+def precheck_workbook(file_path):
+	"Cheap checks before a workbook is parsed. Raises the same errors openpyxl would so open_error_text gives the same message: PermissionError if Excel has the file open or it can't be read, BadZipFile if an .xlsx file is not a zip"
+	import zipfile
+	if has_lock_file(file_path):
+		raise PermissionError(f"{os.path.basename(file_path)} is open in Excel")
+	with open(file_path, "rb") as file: #Windows refuses while Excel holds the file
+		signature = file.read(4)
+	if file_path.lower().endswith((".xlsx", ".xlsm")) and signature != b"PK\x03\x04":
+		raise zipfile.BadZipFile("File is not a zip file")
+
+def open_timesheet(file_path):
+	"Single open step for a timesheet, replaces test_open_file followed by a second load in the parse. Returns (result, error text, (name, week start, rows)) with the same [OPEN FILE], [UNREADABLE] and [UNKNOWN ERROR] messages"
+	try:
+		return True, "", read_timesheet(file_path)
+	except Exception as e:
+		return False, open_error_text(file_path, e), None
+
+def read_timesheet(file_path):
+	"Reads a timesheet with one read only load that read_timesheet_fast parses straight away, only timesheets outside the standard layout are loaded again the old way. Raises the error from opening the file"
+	import openpyxl
+	precheck_workbook(file_path)
+	workbook = openpyxl.load_workbook(file_path, read_only=True)
+	try:
+		timesheet_data = read_timesheet_fast(workbook)
+	finally:
+		workbook.close()
+	if timesheet_data is None:
+		timesheet_data = read_timesheet_full(file_path)
+	return timesheet_data
+
+def open_inotify(folder):
+	"inotify file descriptor watching folder for files that were written and closed or moved in, None where inotify is not available and the folder is only scanned"
+	if not sys.platform.startswith("linux"):
+		return None
+	import ctypes
+	import ctypes.util
+	IN_CLOSE_WRITE = 0x8
+	IN_MOVED_TO = 0x80
+	try:
+		libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno = True)
+		inotify_fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+		if inotify_fd < 0:
+			return None
+		if libc.inotify_add_watch(inotify_fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+			os.close(inotify_fd)
+			return None
+		return inotify_fd
+	except (OSError, AttributeError):
+		return None
+
+def parse_timesheet(file_path, approver_names, timesheet_data = None):
+	"Pure parse and expand step for one timesheet. Returns TimesheetRow records with no Tk or style objects so it can run in a worker process"
+	#param approver_names is the initials -> name dict of the run's ApproverDirectory
+	#param timesheet_data is what open_timesheet already read, None reads the file here
+	if timesheet_data is None:
+		timesheet_data = read_timesheet(file_path)
+	name, sunday_start, rows = timesheet_data
+
+	# Date ordinal for each day of the week, Sunday to Saturday
+	first_ordinal = sunday_start.toordinal()
+	date_ordinals = [first_ordinal + day_offset for day_offset in range(7)]
+
+	## At this point all timesheet data has been read from the sheet. Now the rows are expanded to one record per day worked ##
+
+	# Extract approver initials 
+	removed_last_5 = file_path[:-5]
+	last_space_index = removed_last_5.rindex(" ")
+	approver_initials = removed_last_5[last_space_index:]
+	approver_initials = approver_initials[1:]
+	
+	# look up the approver's full name in the directory built once for the run
+	approver_initials = approver_names.get(approver_initials, approver_initials)
+
+	# The wide rows (one per work line, a column per day) are turned long (one record per day worked) a column at a time.
+	# Everything that only depends on the work line or only on the day is worked out once, not once per cell
+	work_descriptions = [row_data[0] for row_data in rows]
+	notes = [row_data[1] for row_data in rows]
+	time_types = [row_data[2] for row_data in rows]
+	codes = [str(work_description).split("-")[0] for work_description in work_descriptions] #code for second third column data
+	# week of the month for each day, for correct hours column formatting by weeks
+	weeks = [week_of_month_table(day.year, day.month)[day.day] for day in map(date.fromordinal, date_ordinals)]
+	# hours for each day, Sunday to Saturday, each a column of the hours of every work line
+	hours_by_day = list(zip(*(row_data[3:10] for row_data in rows)))
+
+	records = []
+	for date_ordinal, week, day_hours in zip(date_ordinals, weeks, hours_by_day):
+		for line, hours_worked in enumerate(day_hours):
+			# Skip rows with zero hours
+			if hours_worked == 0:
+				continue
+			records.append(TimesheetRow(name, codes[line], date_ordinal, notes[line], work_descriptions[line], time_types[line], approver_initials, hours_worked, week, ()))
+	return records
+
+def is_none_or_spaces(value):
+	"True for a blank cell or one with only spaces"
+	return value is None or str(value).isspace()
+
+def read_timesheet_fast(workbook):
+	"Streaming reader for the standard timesheet layout (C3 name, G3 week start, data from row 13 in columns A, B, D and E to K), given the read only workbook. Reads the whole data region in one pass so rows after any number of empty rows are kept. Returns None if the file does not match the layout"
+	sheet = workbook.active
+	if sheet is None or not hasattr(sheet, "iter_rows"):
+		return None
+	sheet.reset_dimensions() #read only iter_rows stops at the file's dimension tag, which can be stale and would drop rows below it
+	name = None
+	sunday_start = None
+	rows = []
+	for row_idx, row in enumerate(sheet.iter_rows(min_row=1, max_col=11, values_only=True), start=1):
+		row = tuple(row) + (None,) * (11 - len(row)) #short rows are padded to column K
+		if row_idx == 3:
+			name = row[2] #C3
+			sunday_start = row[6] #G3
+			if not isinstance(sunday_start, datetime):
+				return None #week start is not where the layout expects it
+		elif row_idx >= 13:
+			work_description = row[0]
+			if work_description is None:
+				continue #no limit on empty rows since the whole region is read anyway
+			# Get the code for the hours and convert to non coded language
+			pay_type_code = row[3]
+			time_type = PAY_TYPES.get(pay_type_code, pay_type_code) #unknown code stays the same (typo)
+			# Read the hours for each day from Sunday to Saturday in columns E to K
+			hours = [cell_value if cell_value is not None else 0 for cell_value in row[4:11]]
+			rows.append([work_description, row[1], time_type] + hours)
+	if sunday_start is None:
+		return None #sheet ends before row 3
+	return name, sunday_start, rows
+
+def read_timesheet_full(file_path):
+	"Original cell by cell reader, used for timesheets that do not match the standard layout. Stops after 3 empty work descriptions"
+	#open timesheet
+	import openpyxl
+	workbook = openpyxl.load_workbook(file_path)
+	
+	# Select the active sheet in timesheet file, not specified since timesheet file only has one sheet
+	sheet = workbook.active
+
+	# Read the week start date from cell G3
+	sunday_start = sheet['G3'].value
+
+	# Read the name of the person
+	name = sheet['C3'].value
+
+	# Initialize a list to store the rows
+	rows = []
+
+	# Get the maximum row number
+	max_row = sheet.max_row
+
+	# Initialize a counter for empty work descriptions
+	empty_work_desc_counter = 0
+
+	# Iterate over the rows starting from row 13
+	for row in range(13, max_row + 1):
+		# Read the work description from column A
+		work_description = sheet['A' + str(row)].value
+		
+		# Read the note from column B
+		note = sheet['B' + str(row)].value
+		
+		# Get the code for the hours and convert to non coded language
+		pay_type_code = sheet['D' + str(row)].value
+		if pay_type_code == 'ST':
+			time_type = "Regular Hours"
+		elif pay_type_code == 'DT':
+			time_type = "Double Time"
+		elif pay_type_code == 'OT':
+			time_type = "Overtime"
+		else:
+			time_type = pay_type_code #unknown code stays the same (typo)
+		
+		##THIS LOOP STOPS SEARCHING AFTER 3 EMPTY ROWS OF WORK_DESCRIPTION. THIS IS A KEY LIMITING FEATURE##
+		if work_description is None:
+			# Increment the counter for empty work descriptions
+			empty_work_desc_counter += 1
+			
+			# Check if three consecutive empty work descriptions are encountered
+			if empty_work_desc_counter >= 3:
+				break
+			else:
+				continue
+		
+		# Reset the counter for empty work descriptions
+		empty_work_desc_counter = 0
+		
+		# Read the hours for each day from Sunday to Saturday
+		hours = []
+		for day in range(5, 12):
+			cell_value = sheet.cell(row=row, column=day).value
+			hours.append(cell_value if cell_value is not None else 0)
+		
+		# Create a row array with the work description, note, and hours
+		row_data = [work_description, note, time_type] + hours
+		
+		# Append the row array to the list of rows
+		rows.append(row_data)
+
+	# Close the workbook
+	workbook.close()
+	return name, sunday_start, rows
+
+def run_timesheet_job(file_path, approver_names):
+	"Worker process job, opens and parses a timesheet with open_timesheet. Returns (result, text, records, wall seconds, cpu seconds) with the same error text as the serial run, also for a timesheet that opened but could not be parsed"
+	wall_start, cpu_start = time.perf_counter(), time.process_time()
+	result, text, timesheet_data = open_timesheet(file_path)
+	if not result:
+		return False, text, [], time.perf_counter() - wall_start, time.process_time() - cpu_start
+	try:
+		records = parse_timesheet(file_path, approver_names, timesheet_data)
+	except Exception as e:
+		return False, open_error_text(file_path, e), [], time.perf_counter() - wall_start, time.process_time() - cpu_start
+	return True, "", records, time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+def open_error_text(file_path, error, is_master = False):
+	"Turns an error from opening a workbook into the message shown to the user"
+	#param is_master gives the output file wording, whether or not the run names a sheet
+	if isinstance(error, PermissionError):
+		#file is open
+		if is_master:
+			return "The output file you are trying to use is currently open. Please close the file and try again.\n"
+		return "\n[OPEN FILE] " + os.path.basename(file_path) + " is currently open. Please close the file and try again.\n"
+	if isinstance(error, ValueError):
+		#file cannot be read
+		return "\n[UNREADABLE] Unable to read workbook: " + os.path.basename(file_path) + ".\nThis file is unusable and must be entered manually.\n"
+	#generic exception
+	return f"\n[UNKNOWN ERROR] An error occurred while processing the file: {os.path.basename(file_path)}\nError details: {error}\nPlease check the file or enter data manually.\n"
+
+@functools.lru_cache(maxsize=None)
+def week_of_month_table(year, month):
+	"Week of the month for every day of a month, indexed by day (index 0 unused). Worked out once per month"
+	isOneMinus = False # flag to subtract one if month starts on a saturday
+	first_weekday = datetime(year, month, 1).weekday() #weekday of the first day
+	if first_weekday == 5: #check if saturday
+		isOneMinus = True
+	table = [None]
+	for day in range(1, calendar.monthrange(year, month)[1] + 1):
+		adjusted_date = day + first_weekday - 1
+		week_number = adjusted_date // 7 + 1 #calculates
+		table.append(week_number - 1 if isOneMinus else week_number)
+	return table
+
+def get_week_of_month(date):
+	"this is a helper function that calculates the week of the month for the correct hours column formatting by week"
+	date_obj = datetime.strptime(date, "%m/%d/%Y") #convert to datetime object
+	return week_of_month_table(date_obj.year, date_obj.month)[date_obj.day]
+
+@functools.lru_cache(maxsize=None)
+def task_labels(code):
+	"Column C and D text for a task code, e.g. ISTHA4-BR16 and ISTHA Task 4 (Professional SVS Eng). Worked out once per code"
+	return "ISTHA" + code + "-BR16", "ISTHA Task " + code + TASK_NAMES.get(code, "")
+
+def summary_sheet_name(sheet_name):
+	"Name of the payroll summary sheet of a month sheet, e.g. May 2024 Summary"
+	return sheet_name + " Summary"
+
+@functools.lru_cache(maxsize=4096)
+def task_code(code_label):
+	"Task code back from a column C label, e.g. 4 from ISTHA4-BR16. Any other label is its own code. Worked out once per label"
+	match = re.fullmatch(r"ISTHA(.+)-BR16", str(code_label))
+	return match.group(1) if match else code_label
+
+@functools.lru_cache(maxsize=4096)
+def month_sheet_name(date_ordinal):
+	"Master sheet name for the month of a date ordinal, e.g. May 2024"
+	return date.fromordinal(date_ordinal).strftime("%B %Y")
+
+def month_sort_key(sheet_name):
+	"Sorts month sheet names by date, any other sheet name goes after them"
+	try:
+		return (datetime.strptime(sheet_name, "%B %Y"), "")
+	except ValueError:
+		return (datetime.max, sheet_name)
+
+@functools.lru_cache(maxsize=4096)
+def date_text(date_ordinal):
+	"MM/DD/YYYY text written to the master for a date ordinal"
+	return date.fromordinal(date_ordinal).strftime("%m/%d/%Y")
+
+@functools.lru_cache(maxsize=4096)
+def date_sort_value(value):
+	"Sortable form of a date cell, MM/DD/YYYY text and datetimes become ordinals so dates sort correctly across years. Anything else sorts after them by its text"
+	if isinstance(value, datetime):
+		return (value.toordinal(), "")
+	try:
+		return (datetime.strptime(str(value), "%m/%d/%Y").toordinal(), "")
+	except ValueError:
+		return (sys.maxsize, str(value))
+
+def main_cli(argv):
+	"Headless batch mode, runs the same merge, sort and duplicate check as the window with plain logging and no Tk"
+	import argparse
+	import glob
+	import logging
+	parser = argparse.ArgumentParser(prog="tool2.1.py", description="Import approved timesheets into a master file without opening the window.")
+	parser.add_argument("--master", help="master .xlsx file to write to")
+	parser.add_argument("--timesheets", nargs="+", help="timesheet file(s) or glob pattern(s), e.g. \"May/*.xlsx\"")
+	parser.add_argument("--month", help="master sheet to write every row to, e.g. \"May 2024\". Defaults to the sheet for the month of each row's date")
+	parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes used to parse timesheets")
+	parser.add_argument("--delete-duplicates", action="store_true", help="delete duplicate rows after the run instead of only listing them")
+	parser.add_argument("--dedupe-on-ingest", action="store_true", help="skip incoming rows that are already in the master")
+	parser.add_argument("--reimport", action="store_true", help="import every selected timesheet even if the import ledger says it was already imported unchanged")
+	parser.add_argument("--full-resort", action="store_true", help="re-sort and rewrite every row instead of merging new rows into the sorted master")
+	parser.add_argument("--profile", metavar="FILE", help="run under cProfile and write the stats to FILE, e.g. run.prof")
+	parser.add_argument("--watch", metavar="FOLDER", help="keep running and import approved timesheets as they are dropped into FOLDER, in small batches once the folder has been quiet for --settle seconds")
+	parser.add_argument("--settle", type=float, default=5.0, help="seconds a watched file and folder must stay unchanged before a batch is imported")
+	parser.add_argument("--poll", type=float, default=10.0, help="seconds between scans of the watched folder")
+	parser.add_argument("--batch-size", type=int, default=50, help="most timesheets imported from the watched folder in one run")
+	parser.add_argument("--rules", type=lambda text: set(rule.strip() for rule in text.split(",") if rule.strip()), default=set(VALIDATION_RULES), help="comma separated checks to run on the new rows, from " + ", ".join(f"'{rule}' ({description})" for rule, description in VALIDATION_RULES.items()) + ". Defaults to all, \"\" runs none")
+	parser.add_argument("--no-summary", action="store_true", help="do not write the payroll summary sheet next to each month sheet")
+	parser.add_argument("--store", metavar="FILE", help="SQLite file mirroring the master for --query and --export-month, the month sheets each run merges are written to it in one transaction")
+	parser.add_argument("--export-month", metavar="MONTH", help="rewrite this month sheet of --master from --store instead of importing, e.g. \"May 2024\"")
+	parser.add_argument("--query", action="store_true", help="list the rows in --store matching --name, --approver, --task, --from and --to instead of importing")
+	parser.add_argument("--name", help="employee name for --query")
+	parser.add_argument("--approver", help="approver name for --query")
+	parser.add_argument("--task", help="task code for --query, e.g. 4")
+	parser.add_argument("--from", dest="date_from", metavar="MM/DD/YYYY", help="first date for --query")
+	parser.add_argument("--to", dest="date_to", metavar="MM/DD/YYYY", help="last date for --query")
+	args = parser.parse_args(argv)
+	if args.rules - set(VALIDATION_RULES):
+		parser.error(f"unknown --rules {', '.join(sorted(args.rules - set(VALIDATION_RULES)))}")
+	if (args.query or args.export_month) and not args.store:
+		parser.error("--query and --export-month need --store")
+	if not args.query and not args.master:
+		parser.error("the following arguments are required: --master")
+	if not args.query and not args.export_month and not args.watch and not args.timesheets:
+		parser.error("the following arguments are required: --timesheets")
+	logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+	
+	if args.query:
+		# lookups go to the store's indexes, the master is not opened
+		try:
+			start_ordinal = datetime.strptime(args.date_from, "%m/%d/%Y").toordinal() if args.date_from else None
+			end_ordinal = datetime.strptime(args.date_to, "%m/%d/%Y").toordinal() if args.date_to else None
+		except ValueError:
+			parser.error("--from and --to take dates as MM/DD/YYYY")
+		store = TimesheetStore(args.store)
+		found = store.query(args.name, args.approver, args.task, start_ordinal, end_ordinal)
+		store.close()
+		display = LogDisplay()
+		for row in found:
+			display.write(" | ".join("" if value is None else str(value) for value in row))
+		display.write(f"{len(found)} rows found.\n")
+		return 0
+	
+	if args.export_month:
+		my_instance = MyClass(LogDisplay())
+		my_instance.store_path = args.store
+		my_instance.payroll_summary = not args.no_summary
+		result = my_instance.export_month(args.master, args.export_month)
+		if my_instance.master is not None:
+			my_instance.master.close()
+		return 0 if result else 1
+	
+	# expand the patterns, sorted so a folder is always processed in the same order
+	timesheet_file_paths = sorted(set(path for pattern in args.timesheets or [] for path in glob.glob(pattern)))
+	if not timesheet_file_paths and not args.watch:
+		logging.getLogger("timesheets").error("No timesheets match %s", " ".join(args.timesheets))
+		return 1
+	
+	my_instance = MyClass(LogDisplay())
+	my_instance.worker_count = args.workers
+	my_instance.incremental_merge = not args.full_resort
+	my_instance.dedupe_on_ingest = args.dedupe_on_ingest
+	my_instance.use_ledger = not args.reimport
+	my_instance.store_path = args.store
+	my_instance.payroll_summary = not args.no_summary
+	my_instance.validation_rules = args.rules
+	if args.watch:
+		my_instance.watch_folder(args.master, args.watch, args.settle, args.poll, args.batch_size)
+		return 0
+	result = run_with_profile(args.profile, my_instance.display, my_instance.run_pipeline, args.master, timesheet_file_paths, args.month)
+	if result and args.delete_duplicates and my_instance.duplicate_rows:
+		duplicate_rows_text = my_instance.duplicates_text()
+		if my_instance.delete_duplicates(my_instance.master):
+			my_instance.display.write(f"Deletion Complete, you deleted {duplicate_rows_text}.\n")
+		else:
+			result = False
+	if my_instance.master is not None:
+		my_instance.display.write(my_instance.master.summary())
+		my_instance.master.close()
+	return 0 if result else 1
+
+def run_with_profile(profile_path, display, function, *args):
+	"Runs function, under cProfile when profile_path is set. The stats are written to profile_path for pstats and the slowest calls by cumulative time are shown"
+	if not profile_path:
+		return function(*args)
+	import cProfile
+	import pstats
+	import io
+	profiler = cProfile.Profile()
+	try:
+		return profiler.runcall(function, *args)
+	finally:
+		profiler.dump_stats(profile_path)
+		stats_text = io.StringIO()
+		pstats.Stats(profiler, stream = stats_text).sort_stats("cumulative").print_stats(15)
+		display.write(f"\nProfile written to {profile_path}\n{stats_text.getvalue()}")
+
+def timed_import(module_name):
+	"Imports a module and records how long the first import took for the startup report"
+	start = time.perf_counter()
+	module = importlib.import_module(module_name)
+	startup_times.setdefault(module_name, time.perf_counter() - start)
+	return module
+
+def startup_report():
+	"Text of the startup timing report, time per import and step and the time until the window was shown against STARTUP_BUDGET"
+	lines = ["Startup timing:"]
+	for step, seconds in startup_times.items():
+		lines.append(f"  {step}: {seconds * 1000:.0f} ms")
+	shown = startup_times.get("window shown")
+	if shown is not None:
+		verdict = "within" if shown <= STARTUP_BUDGET else "OVER"
+		lines.append(f"Window shown after {shown:.2f} s, {verdict} the {STARTUP_BUDGET:.1f} s budget")
+	return "\n".join(lines) + "\n"
 
 def resource_path(relative_path):
 	"This method makes it so that when this program is packaged as an exe it can find the image path and open it without needing the file"
@@ -820,46 +2202,91 @@ def resource_path(relative_path):
 		base_path = os.path.abspath(".")
 	return os.path.join(base_path,relative_path)
 
-# Create an instance of the class
-my_instance = MyClass()
+# The window is only built when the file is run directly, worker processes and other scripts import this file and must not open a window
+if __name__ == "__main__":
+	import multiprocessing
+	multiprocessing.freeze_support() #needed for the process pool in the packaged exe
+	
+	# Any arguments run the headless batch mode, e.g. python tool2.1.py --master Master.xlsx --timesheets "May/*.xlsx"
+	if len(sys.argv) > 1:
+		sys.exit(main_cli(sys.argv[1:]))
+	
+	# Tk and PIL are only imported for the window, each import is timed for the startup report
+	tk = timed_import("tkinter")
+	filedialog = timed_import("tkinter.filedialog")
+	messagebox = timed_import("tkinter.messagebox")
+	scrolledtext = timed_import("tkinter.scrolledtext")
+	Label = tk.Label
+	Checkbutton = tk.Checkbutton
+	Image = timed_import("PIL.Image")
+	ImageTk = timed_import("PIL.ImageTk")
+	
+	# Create an instance of the class
+	my_instance = MyClass()
 
-# Create the main Tkinter window
-root = tk.Tk()
-root.title("Timesheet Program")
+	# Create the main Tkinter window
+	root = tk.Tk()
+	root.title("Timesheet Program")
 
-# Create a button to trigger the PDF highlighting process
-timesheet_button = tk.Button(root, text="Select output file and timesheets", command=my_instance.run_timesheets)
-timesheet_button.grid(row =1, column =1, sticky = "w", padx=10, pady =5)
+	# Create a button to trigger the PDF highlighting process
+	timesheet_button = tk.Button(root, text="Select output file and timesheets", command=my_instance.run_timesheets)
+	timesheet_button.grid(row =1, column =1, sticky = "w", padx=10, pady =5)
 
-instructions_button = tk.Button(root, text = "Press to display instructions", command =my_instance.display_instructions)
-instructions_button.grid(row =3, column =1, sticky = "w", padx=10,pady =5)
+	instructions_button = tk.Button(root, text = "Press to display instructions", command =my_instance.display_instructions)
+	instructions_button.grid(row =3, column =1, sticky = "w", padx=10,pady =5)
+	
+	# Checkbox for dedupe on ingest, rows already in the master are skipped instead of listed as duplicates
+	dedupe_variable = tk.BooleanVar(value = False)
+	dedupe_checkbox = Checkbutton(root, text = "Skip rows already in the master", variable = dedupe_variable)
+	dedupe_checkbox.grid(row =1, column =2, padx = 25, pady = 5)
+	
+	# Checkbox to import timesheets again that the import ledger says were already imported unchanged
+	reimport_variable = tk.BooleanVar(value = False)
+	reimport_checkbox = Checkbutton(root, text = "Import already imported timesheets again", variable = reimport_variable)
+	reimport_checkbox.grid(row =1, column =1, sticky = "e", padx = 10, pady = 5)
 
-close_button = tk.Button(root, text="Close", command=root.quit)
-close_button.grid(row=3, column=2, padx = 25, pady = 5)
+	close_button = tk.Button(root, text="Close", command=root.quit)
+	close_button.grid(row=3, column=2, padx = 25, pady = 5)
+	root.protocol("WM_DELETE_WINDOW", my_instance.close_window) #the close box waits for a running import instead of killing it
 
-# Create a scrolled text box
-scroll_text = scrolledtext.ScrolledText(root, width=91, height=30, state='disabled')
-scroll_text.grid(row =2, column =1, columnspan =2, sticky = "wens", padx =5, pady=5)
+	# Create a scrolled text box
+	scroll_text = scrolledtext.ScrolledText(root, width=91, height=30, state='disabled')
+	scroll_text.grid(row =2, column =1, columnspan =2, sticky = "wens", padx =5, pady=5)
+	
+	# Status line for progress under the text box, and Cancel to stop a run before the master is saved
+	status_label = Label(root, text = "", anchor = "w")
+	status_label.grid(row =4, column =1, sticky = "we", padx =10, pady =5)
+	cancel_button = tk.Button(root, text = "Cancel", command = my_instance.cancel_run, state = tk.DISABLED)
+	cancel_button.grid(row =4, column =2, padx = 25, pady = 5)
+	my_instance.display = WindowDisplay(root, scroll_text, status_label)
+	my_instance.profile_path = os.environ.get("TIMESHEET_PROFILE") #set to a file name to profile the first run from the window
 
-## Image Display, scaled from 3900x2517, scaled down by factor of 22
-#THIS IMAGE DISPLAY ONLY WORKS WHEN THE FILE IS PACKAGED AS AN EXE, FOR NON EXE CHANGE IMAGE_FILE_PATH TO ACTUAL FILE PATH OF JWI LOGO
-image_label = Label(root)
-image_label.grid(row =2, column = 0, sticky = "w", padx = 10, pady =10)
-image_file_path = resource_path("JWI Gray Logo.jpg") #call the method for the filepath
-image=Image.open(image_file_path)
-image=image.resize((177,114),Image.Resampling.LANCZOS)
-photo = ImageTk.PhotoImage(image)
-image_label.configure(image=photo)
-image_label.image = photo
+	## Image Display, scaled from 3900x2517, scaled down by factor of 22
+	#THIS IMAGE DISPLAY ONLY WORKS WHEN THE FILE IS PACKAGED AS AN EXE, FOR NON EXE CHANGE IMAGE_FILE_PATH TO ACTUAL FILE PATH OF JWI LOGO
+	image_label = Label(root)
+	image_label.grid(row =2, column = 0, sticky = "w", padx = 10, pady =10)
+	image_start = time.perf_counter()
+	image_file_path = resource_path("JWI Gray Logo.jpg") #call the method for the filepath
+	image=Image.open(image_file_path)
+	image=image.resize((177,114),Image.Resampling.LANCZOS)
+	photo = ImageTk.PhotoImage(image)
+	image_label.configure(image=photo)
+	image_label.image = photo
+	startup_times["logo image"] = time.perf_counter() - image_start
 
-root.grid_rowconfigure(2, weight =1) #expands row 2 to fill screen
-root.grid_columnconfigure(1, weight =1) #expands column 1 to fill screen
+	root.grid_rowconfigure(2, weight =1) #expands row 2 to fill screen
+	root.grid_columnconfigure(1, weight =1) #expands column 1 to fill screen
 
-# Sets the window location on the console
-root.geometry("+175+175")
+	# Sets the window location on the console
+	root.geometry("+175+175")
+	
+	# Record when the window is first shown, set TIMESHEET_STARTUP_REPORT=1 to print the startup timing report in the window
+	def window_shown(event):
+		if event.widget is root and "window shown" not in startup_times:
+			startup_times["window shown"] = time.perf_counter() - PROGRAM_START
+			if os.environ.get("TIMESHEET_STARTUP_REPORT"):
+				my_instance.display.write(startup_report())
+	root.bind("<Map>", window_shown)
 
-# Run the Tkinter event loop
-root.mainloop()		
-		
-		
-		
\ No newline at end of file
+	# Run the Tkinter event loop
+	root.mainloop()